@@ -5,10 +5,11 @@ import datetime
 import json
 import logging
 import os
+import signal
+import sys
 import time
 
 import routine_sequence_qc_collector.config
-import routine_sequence_qc_collector.core as core
 
 from routine_sequence_qc_collector.logging_config import configure_logging
 
@@ -16,12 +17,307 @@ DEFAULT_SCAN_INTERVAL_SECONDS = 3600.0
 
 log = logging.getLogger(__name__)
 
+
+def plan(config, analysis_dirs, force=False):
+    """
+    Report the collection work that is pending for a set of analysis dirs, without writing anything.
+    The report is printed to stdout as json.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param analysis_dirs: Analysis dirs to plan collection for. None values are skipped.
+    :type analysis_dirs: Iterator[Optional[dict[str, str]]]
+    :param force: Plan to re-collect outputs that are up to date.
+    :type force: bool
+    :return: None
+    :rtype: None
+    """
+    import routine_sequence_qc_collector.core as core
+
+    planned_runs = []
+    for analysis_dir in analysis_dirs:
+        run_plan = core.plan_collection(config, analysis_dir, force=force)
+        if run_plan is not None:
+            planned_runs.append(core.summarize_plan(run_plan))
+
+    total_bytes_to_copy = sum(run['bytes_to_copy'] for run in planned_runs)
+    total_bytes_to_read = sum(run['bytes_to_read'] for run in planned_runs)
+    throughput_bytes_per_second = core.estimate_throughput_bytes_per_second(config)
+    estimated_duration_seconds = None
+    if throughput_bytes_per_second:
+        estimated_duration_seconds = total_bytes_to_copy / throughput_bytes_per_second
+
+    report = {
+        'num_runs_pending': len([run for run in planned_runs if run['bytes_to_copy'] > 0 or run['bytes_to_read'] > 0]),
+        'total_bytes_to_copy': total_bytes_to_copy,
+        'total_bytes_to_read': total_bytes_to_read,
+        'throughput_bytes_per_second': throughput_bytes_per_second,
+        'estimated_duration_seconds': estimated_duration_seconds,
+        'runs': planned_runs,
+    }
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+def collect(config, analysis_dirs, workers=1, force=False):
+    """
+    Collect outputs for a set of analysis dirs, then print a summary to stdout as json.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param analysis_dirs: Analysis dirs to collect. None values are skipped.
+    :type analysis_dirs: Iterator[Optional[dict[str, str]]]
+    :param workers: Number of runs to collect in parallel.
+    :type workers: int
+    :param force: Overwrite outputs that have already been collected.
+    :type force: bool
+    :return: Summary of the collection. Keys: ['num_runs_selected', 'num_runs_skipped', 'num_runs_collected', 'num_runs_failed', 'failed_run_ids', 'bytes_copied', 'duration_seconds']
+    :rtype: dict[str, object]
+    """
+    import concurrent.futures
+    import routine_sequence_qc_collector.core as core
+    import routine_sequence_qc_collector.failures as failures
+
+    core.create_output_dirs(config)
+    collect_start_timestamp = datetime.datetime.now()
+    # Runs are collected even if they are quarantined, since they were selected
+    # explicitly, but the outcome is still recorded.
+    failure_registry = failures.load_failure_registry(config)
+
+    def collect_run(analysis_dir):
+        run_plan = core.plan_collection(config, analysis_dir, force=force, failure_registry=failure_registry)
+        return core.collect_outputs(config, analysis_dir, plan=run_plan, failure_registry=failure_registry)
+
+    analysis_dirs = list(analysis_dirs)
+    # Selected runs that aren't ready to collect (incomplete, excluded, etc.) are skipped.
+    selected_analysis_dirs = [analysis_dir for analysis_dir in analysis_dirs if analysis_dir is not None]
+    collected_run_ids = []
+    failed_run_ids = []
+    bytes_copied = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(collect_run, analysis_dir): os.path.basename(analysis_dir['path']) for analysis_dir in selected_analysis_dirs}
+        for future in concurrent.futures.as_completed(futures):
+            run_id = futures[future]
+            try:
+                run_plan = future.result()
+            except Exception as e:
+                log.exception({"event_type": "collect_outputs_failed", "sequencing_run_id": run_id})
+                run_plan = None
+            if run_plan is None:
+                failed_run_ids.append(run_id)
+            else:
+                collected_run_ids.append(run_id)
+                bytes_copied += run_plan['bytes_to_copy']
+
+    summary = {
+        'num_runs_selected': len(analysis_dirs),
+        'num_runs_skipped': len(analysis_dirs) - len(selected_analysis_dirs),
+        'num_runs_collected': len(collected_run_ids),
+        'num_runs_failed': len(failed_run_ids),
+        'failed_run_ids': sorted(failed_run_ids),
+        'bytes_copied': bytes_copied,
+        'duration_seconds': (datetime.datetime.now() - collect_start_timestamp).total_seconds(),
+    }
+    log.info({"event_type": "collect_complete", **summary})
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+
+    return summary
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config')
     parser.add_argument('--log-level')
+    parser.add_argument('--plan', action='store_true', help="Print the pending collection work as json and exit, without writing anything.")
+    parser.add_argument('--profile-cycles', type=int, metavar='N', help="Profile the first N scan cycles, writing profiles to the 'profiles' subdirectory of the output dir (default: 'profile_cycles' from config, if set).")
+    subparsers = parser.add_subparsers(dest='command')
+    collect_parser = subparsers.add_parser('collect', help="Collect a selection of runs once, then exit.")
+    collect_parser.add_argument('run_ids', nargs='*', metavar='RUN_ID', help="Run IDs to collect.")
+    collect_parser.add_argument('--run-glob', help="Collect runs whose run ID matches this glob pattern (eg. '2401*_M*').")
+    collect_parser.add_argument('--start-date', type=datetime.date.fromisoformat, help="Collect runs on or after this date (YYYY-MM-DD), parsed from the run ID.")
+    collect_parser.add_argument('--end-date', type=datetime.date.fromisoformat, help="Collect runs on or before this date (YYYY-MM-DD), parsed from the run ID.")
+    collect_parser.add_argument('-w', '--workers', type=int, default=1, help="Number of runs to collect in parallel (default: 1).")
+    collect_parser.add_argument('--force', action='store_true', help="Overwrite outputs that have already been collected.")
+    prune_parser = subparsers.add_parser('prune', help="Delete collected outputs for excluded, retired or old runs, then exit.")
+    prune_parser.add_argument('run_ids', nargs='*', metavar='RUN_ID', help="Run IDs to prune.")
+    prune_parser.add_argument('--excluded', action='store_true', help="Prune runs listed in the 'excluded_runs_list'.")
+    prune_parser.add_argument('--older-than-months', type=int, help="Prune runs older than this many months, by the date parsed from the run ID (default: 'retention_months' from config, if set and no RUN_ID or --excluded is given).")
+    prune_parser.add_argument('-w', '--workers', type=int, default=4, help="Number of runs to delete in parallel (default: 4).")
+    quarantine_parser = subparsers.add_parser('quarantine', help="List (or clear) runs that are skipped because they failed collection recently, then exit.")
+    quarantine_parser.add_argument('run_ids', nargs='*', metavar='RUN_ID', help="Run IDs to list or clear (default: all).")
+    quarantine_parser.add_argument('--clear', action='store_true', help="Remove runs from quarantine, so they are collected on the next scan.")
+    changes_parser = subparsers.add_parser('changes', help="Print the change feed of collected runs as json lines, then exit.")
+    changes_parser.add_argument('--since', type=int, default=0, metavar='SEQ', help="Only print changes after this sequence number (default: 0).")
     args = parser.parse_args()
 
+    # Subcommands import only the modules they need, to keep startup fast
+    # for short-lived invocations.
+    if args.command == 'prune':
+        run_prune(args)
+    elif args.command == 'changes':
+        run_changes(args)
+    elif args.command == 'quarantine':
+        run_quarantine(args)
+    elif args.command == 'collect':
+        if not any([args.run_ids, args.run_glob, args.start_date, args.end_date]):
+            parser.error("collect: at least one of RUN_ID, --run-glob, --start-date or --end-date is required")
+        run_collect(args)
+    elif args.plan:
+        run_plan(args)
+    else:
+        run_daemon(args)
+
+
+def run_prune(args):
+    """
+    Prune collected runs, print a summary to stdout as json, then exit.
+
+    :param args: Parsed command-line arguments.
+    :type args: argparse.Namespace
+    :return: None
+    :rtype: None
+    """
+    import routine_sequence_qc_collector.prune
+
+    # Keep stdout clean for the json report.
+    configure_logging(args.log_level, stream=sys.stderr)
+    config = routine_sequence_qc_collector.config.load_config(args.config)
+    older_than_months = args.older_than_months
+    # The configured retention period only applies when no runs are selected
+    # explicitly, so that a targeted prune doesn't also sweep old runs.
+    if older_than_months is None and not (args.run_ids or args.excluded):
+        older_than_months = config.get('retention_months', None)
+    collected_run_ids = routine_sequence_qc_collector.prune.find_collected_run_ids(config)
+    run_ids_to_prune = routine_sequence_qc_collector.prune.select_runs_to_prune(
+        config,
+        collected_run_ids,
+        excluded=args.excluded,
+        retention_months=older_than_months,
+    )
+    run_ids_to_prune = sorted(set(run_ids_to_prune) | (set(args.run_ids) & collected_run_ids))
+    summary = routine_sequence_qc_collector.prune.prune(config, run_ids_to_prune, workers=args.workers, dry_run=args.plan)
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+    exit(0 if summary['num_runs_failed'] == 0 else 1)
+
+
+def run_changes(args):
+    """
+    Print the change feed from an offset to stdout as json lines, then exit.
+
+    :param args: Parsed command-line arguments.
+    :type args: argparse.Namespace
+    :return: None
+    :rtype: None
+    """
+    import routine_sequence_qc_collector.changes as changes
+
+    # Keep stdout clean for the change records.
+    configure_logging(args.log_level, stream=sys.stderr)
+    config = routine_sequence_qc_collector.config.load_config(args.config)
+    for record in changes.read_changes(config, since_seq=args.since):
+        print(json.dumps(record))
+    exit(0)
+
+
+def run_quarantine(args):
+    """
+    List quarantined runs as json on stdout, optionally removing them from quarantine, then exit.
+
+    :param args: Parsed command-line arguments.
+    :type args: argparse.Namespace
+    :return: None
+    :rtype: None
+    """
+    import routine_sequence_qc_collector.failures as failures
+
+    # Keep stdout clean for the json report.
+    configure_logging(args.log_level, stream=sys.stderr)
+    config = routine_sequence_qc_collector.config.load_config(args.config)
+    failure_registry = failures.load_failure_registry(config)
+    run_ids = args.run_ids if args.run_ids else sorted(failure_registry.keys())
+    selected_failures = []
+    for run_id in run_ids:
+        if run_id in failure_registry:
+            failure = dict(failure_registry[run_id])
+            failure['quarantined'] = failures.is_quarantined(failure_registry, run_id)
+            selected_failures.append(failure)
+
+    if args.clear:
+        failures.clear_failures(config, failure_registry, [failure['sequencing_run_id'] for failure in selected_failures])
+
+    json.dump(selected_failures, sys.stdout, indent=2)
+    print()
+    exit(0)
+
+
+def run_collect(args):
+    """
+    Collect (or plan collection for) a selection of runs, then exit.
+
+    :param args: Parsed command-line arguments.
+    :type args: argparse.Namespace
+    :return: None
+    :rtype: None
+    """
+    import routine_sequence_qc_collector.core as core
+
+    # Keep stdout clean for the json report.
+    configure_logging(args.log_level, stream=sys.stderr)
+    config = routine_sequence_qc_collector.config.load_config(args.config)
+    analysis_dirs = core.select_analysis_dirs(
+        config,
+        run_ids=args.run_ids,
+        run_id_glob=args.run_glob,
+        start_date=args.start_date,
+        end_date=args.end_date,
+    )
+    if args.plan:
+        plan(config, analysis_dirs, force=args.force)
+        exit(0)
+    summary = collect(config, analysis_dirs, workers=args.workers, force=args.force)
+    exit(0 if summary['num_runs_failed'] == 0 else 1)
+
+
+def run_plan(args):
+    """
+    Plan collection for all analysis dirs, then exit.
+
+    :param args: Parsed command-line arguments.
+    :type args: argparse.Namespace
+    :return: None
+    :rtype: None
+    """
+    import routine_sequence_qc_collector.core as core
+    import routine_sequence_qc_collector.failures as failures
+
+    # Keep stdout clean for the plan report.
+    configure_logging(args.log_level, stream=sys.stderr)
+    config = routine_sequence_qc_collector.config.load_config(args.config)
+    failure_registry = failures.load_failure_registry(config)
+    plan(config, core.scan(config, failure_registry=failure_registry))
+    exit(0)
+
+
+def run_daemon(args):
+    """
+    Scan for runs and collect their outputs, every 'scan_interval_seconds', until interrupted.
+    If 'adaptive_scan_scheduling' is enabled, the interval is adjusted to when runs are likely
+    to arrive (see `scheduling.get_next_scan_interval`). Scans start at regular intervals,
+    so the time taken by each scan is subtracted from the time until the next one.
+    Sending SIGUSR1 to the process profiles the next scan cycle.
+
+    :param args: Parsed command-line arguments.
+    :type args: argparse.Namespace
+    :return: None
+    :rtype: None
+    """
+    import routine_sequence_qc_collector.core as core
+    import routine_sequence_qc_collector.failures as failures
+    import routine_sequence_qc_collector.profiling as profiling
+    import routine_sequence_qc_collector.scheduling as scheduling
+
     configure_logging(args.log_level)
 
     config = {}
@@ -29,6 +325,19 @@ def main():
 
     quit_when_safe = False
 
+    arrival_history = None
+    num_idle_scans = 0
+
+    # None until the first config is loaded, so that the 'profile_cycles' config value can be used.
+    profile_cycles_remaining = args.profile_cycles
+
+    def arm_profiling(signum, frame):
+        nonlocal profile_cycles_remaining
+        profile_cycles_remaining = (profile_cycles_remaining or 0) + 1
+
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, arm_profiling)
+
     while(True):
         if quit_when_safe:
             exit(0)
@@ -48,6 +357,12 @@ def main():
 
             core.create_output_dirs(config)
 
+            if profile_cycles_remaining is None:
+                profile_cycles_remaining = int(config.get('profile_cycles', 0))
+            cycle_profile = None
+            if profile_cycles_remaining > 0:
+                cycle_profile = profiling.start_cycle_profile()
+
             scan_start_timestamp = datetime.datetime.now()
 
             runs = core.find_runs(config)
@@ -56,26 +371,31 @@ def main():
                 json.dump(runs, f, indent=2)
             log.info({"event_type": "write_runs_file_complete", "runs_file": runs_output_file})
 
-            for run in core.scan(config):
+            if config.get('adaptive_scan_scheduling', False):
+                if arrival_history is None:
+                    arrival_history = scheduling.load_arrival_history(config)
+                arrival_history = scheduling.update_arrival_history(config, runs, arrival_history)
+
+            failure_registry = failures.load_failure_registry(config)
+            num_runs_collected = 0
+            for run in core.scan(config, failure_registry=failure_registry):
                 if run is not None:
                     try:
                         config = routine_sequence_qc_collector.config.load_config(args.config)
                         log.info({"event_type": "config_loaded", "config_file": os.path.abspath(args.config)})
                     except json.decoder.JSONDecodeError as e:
                         log.error({"event_type": "load_config_failed", "config_file": os.path.abspath(args.config)})
-                    core.collect_outputs(config, run)
+                    run_plan = core.collect_outputs(config, run, failure_registry=failure_registry)
+                    if run_plan is not None and run_plan['bytes_to_copy'] > 0:
+                        num_runs_collected += 1
                 if quit_when_safe:
                     exit(0)
+            if cycle_profile is not None:
+                profiling.finish_cycle_profile(config, cycle_profile)
+                profile_cycles_remaining -= 1
             scan_complete_timestamp = datetime.datetime.now()
             scan_duration_delta = scan_complete_timestamp - scan_start_timestamp
             scan_duration_seconds = scan_duration_delta.total_seconds()
-            scan_interval_seconds = config.get('scan_interval_seconds', None)
-            if scan_interval_seconds:
-                next_scan_timestamp = datetime.datetime.now() + datetime.timedelta(seconds=scan_interval_seconds)
-            log.info({"event_type": "scan_complete", "scan_duration_seconds": scan_duration_seconds, "timestamp_next_scan": str(next_scan_timestamp.isoformat())})
-
-            if quit_when_safe:
-                exit(0)
 
             if "scan_interval_seconds" in config:
                 try:
@@ -84,7 +404,27 @@ def main():
                     config['scan_interval_seconds'] = DEFAULT_SCAN_INTERVAL_SECONDS
             else:
                     config['scan_interval_seconds'] = DEFAULT_SCAN_INTERVAL_SECONDS
-            time.sleep(config['scan_interval_seconds'])
+
+            if num_runs_collected > 0:
+                num_idle_scans = 0
+            else:
+                num_idle_scans += 1
+            next_scan_interval = scheduling.get_next_scan_interval(config, arrival_history['run_arrivals'] if arrival_history else [], num_runs_collected, num_idle_scans, now=scan_start_timestamp)
+            next_scan_timestamp = scan_start_timestamp + datetime.timedelta(seconds=next_scan_interval['scan_interval_seconds'])
+            log.info({
+                "event_type": "scan_complete",
+                "scan_duration_seconds": scan_duration_seconds,
+                "num_runs_collected": num_runs_collected,
+                "scan_interval_seconds": next_scan_interval['scan_interval_seconds'],
+                "scan_interval_reason": next_scan_interval['reason'],
+                "timestamp_next_scan": str(next_scan_timestamp.isoformat()),
+            })
+
+            if quit_when_safe:
+                exit(0)
+
+            # If the scan took longer than the interval, the next one starts straight away.
+            time.sleep(max((next_scan_timestamp - datetime.datetime.now()).total_seconds(), 0.0))
         except KeyboardInterrupt as e:
             log.info({"event_type": "quit_when_safe_enabled"})
             quit_when_safe = True
@@ -0,0 +1,250 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+from typing import Iterator
+
+import routine_sequence_qc_collector.locking as locking
+
+log = logging.getLogger(__name__)
+
+CHANGES_SUBDIR = 'changes'
+SEGMENT_FILENAME_PREFIX = 'changes-'
+SEGMENT_FILENAME_SUFFIX = '.jsonl'
+LOCK_FILENAME = 'changes.lock'
+
+DEFAULT_SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+DEFAULT_MAX_SEGMENTS = 8
+
+# Runs may be collected in parallel, so appends are serialized. Other processes
+# (the daemon, `collect`, `prune`) are excluded by a lock file in the changes dir.
+change_feed_lock = threading.Lock()
+
+
+def get_changes_dir(config: dict[str, object]) -> str:
+    """
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: Path to the change feed directory.
+    :rtype: str
+    """
+    return os.path.join(config['output_dir'], CHANGES_SUBDIR)
+
+
+def get_segment_path(config: dict[str, object], first_seq: int) -> str:
+    """
+    Segment files are named by the sequence number of their first record,
+    zero-padded so that they sort in order.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param first_seq: Sequence number of the first record in the segment.
+    :type first_seq: int
+    :return: Path to the segment file.
+    :rtype: str
+    """
+    return os.path.join(get_changes_dir(config), SEGMENT_FILENAME_PREFIX + '{:012d}'.format(first_seq) + SEGMENT_FILENAME_SUFFIX)
+
+
+def list_segments(config: dict[str, object]) -> list[tuple[int, str]]:
+    """
+    List the change feed segments, oldest first.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: Sequence number of the first record, and path, for each segment.
+    :rtype: list[tuple[int, str]]
+    """
+    changes_dir = get_changes_dir(config)
+    if not os.path.isdir(changes_dir):
+        return []
+
+    segments = []
+    for filename in os.listdir(changes_dir):
+        if filename.startswith(SEGMENT_FILENAME_PREFIX) and filename.endswith(SEGMENT_FILENAME_SUFFIX):
+            try:
+                first_seq = int(filename[len(SEGMENT_FILENAME_PREFIX):-len(SEGMENT_FILENAME_SUFFIX)])
+            except ValueError as e:
+                continue
+            segments.append((first_seq, os.path.join(changes_dir, filename)))
+
+    return sorted(segments)
+
+
+def read_last_seq(segment_path: str) -> int:
+    """
+    Read the sequence number of the last record in a segment, without reading the whole file.
+
+    :param segment_path: Path to the segment file.
+    :type segment_path: str
+    :return: Sequence number of the last record, or 0 if the segment is empty.
+    :rtype: int
+    """
+    with open(segment_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        # Records are short, so the last one is within the final few kilobytes.
+        f.seek(max(0, position - 8192))
+        lines = f.read().splitlines()
+
+    for line in reversed(lines):
+        try:
+            return json.loads(line)['seq']
+        except (ValueError, KeyError) as e:
+            continue
+
+    return 0
+
+
+def read_segment(segment_path: str) -> Iterator[dict[str, object]]:
+    """
+    Read all records in a segment. Incomplete lines (eg. from an interrupted write) are skipped.
+
+    :param segment_path: Path to the segment file.
+    :type segment_path: str
+    :return: Change records.
+    :rtype: Iterator[dict[str, object]]
+    """
+    with open(segment_path, 'r') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                continue
+
+
+def compact_segments(config: dict[str, object], segments: list[tuple[int, str]]):
+    """
+    Compact closed segments into a single segment, keeping only the latest record
+    for each run. For updates, the artifact kinds of all updates since the run was
+    last deleted are merged into the latest record, so a consumer that resumes from
+    any offset still sees every kind of artifact that changed after it.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param segments: Segments to compact, oldest first.
+    :type segments: list[tuple[int, str]]
+    :return: None
+    :rtype: None
+    """
+    latest_record_by_run_id = {}
+    for first_seq, segment_path in segments:
+        for record in read_segment(segment_path):
+            run_id = record['sequencing_run_id']
+            previous_record = latest_record_by_run_id.get(run_id, None)
+            if record['action'] == 'updated' and previous_record is not None and previous_record['action'] == 'updated':
+                record['artifact_kinds'] = sorted(set(previous_record['artifact_kinds']) | set(record['artifact_kinds']))
+            latest_record_by_run_id[run_id] = record
+
+    compacted_records = sorted(latest_record_by_run_id.values(), key=lambda record: record['seq'])
+    if not compacted_records:
+        return None
+
+    compacted_segment_path = get_segment_path(config, compacted_records[0]['seq'])
+    tmp_segment_path = compacted_segment_path + '.tmp'
+    with open(tmp_segment_path, 'w') as f:
+        for record in compacted_records:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+    # The compacted segment replaces the oldest one before the others are removed, so
+    # an interruption leaves duplicate records (which readers skip) rather than losing any.
+    os.replace(tmp_segment_path, compacted_segment_path)
+    for first_seq, segment_path in segments:
+        if segment_path != compacted_segment_path:
+            os.remove(segment_path)
+
+    log.info({
+        "event_type": "compact_change_feed_complete",
+        "num_segments_compacted": len(segments),
+        "num_records": len(compacted_records),
+        "segment_path": compacted_segment_path,
+    })
+
+
+def append_changes(config: dict[str, object], changes: list[dict[str, object]]) -> list[dict[str, object]]:
+    """
+    Append records to the change feed. Each record is assigned the next sequence number.
+    When the active segment grows larger than 'change_feed_segment_max_bytes', a new
+    segment is started, and once there are more than 'change_feed_max_segments' closed
+    segments, they are compacted.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param changes: Changes. Keys: ['sequencing_run_id', 'action', 'artifact_kinds']. Action is one of: 'updated', 'deleted'
+    :type changes: list[dict[str, object]]
+    :return: The records that were appended. Keys: ['seq', 'timestamp', 'sequencing_run_id', 'action', 'artifact_kinds']
+    :rtype: list[dict[str, object]]
+    """
+    if not changes:
+        return []
+
+    segment_max_bytes = int(config.get('change_feed_segment_max_bytes', DEFAULT_SEGMENT_MAX_BYTES))
+    max_segments = int(config.get('change_feed_max_segments', DEFAULT_MAX_SEGMENTS))
+
+    os.makedirs(get_changes_dir(config), exist_ok=True)
+    with change_feed_lock, locking.file_lock(os.path.join(get_changes_dir(config), LOCK_FILENAME)):
+        segments = list_segments(config)
+        if segments:
+            active_first_seq, active_segment_path = segments[-1]
+            last_seq = read_last_seq(active_segment_path)
+            if last_seq == 0:
+                last_seq = active_first_seq - 1
+            if os.path.getsize(active_segment_path) >= segment_max_bytes:
+                # Start a new segment. All of the existing segments are now closed.
+                active_segment_path = get_segment_path(config, last_seq + 1)
+                if len(segments) > max_segments:
+                    compact_segments(config, segments)
+        else:
+            last_seq = 0
+            active_segment_path = get_segment_path(config, 1)
+
+        timestamp = datetime.datetime.now().isoformat()
+        records = []
+        for seq, change in enumerate(changes, start=last_seq + 1):
+            record = {
+                'seq': seq,
+                'timestamp': timestamp,
+                'sequencing_run_id': change['sequencing_run_id'],
+                'action': change['action'],
+                'artifact_kinds': sorted(change['artifact_kinds']),
+            }
+            records.append(record)
+
+        with open(active_segment_path, 'a+b') as f:
+            # If an earlier write was interrupted, the segment ends with an incomplete line.
+            # End it, so that the new records don't run on from it and become unreadable too.
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode('utf-8'))
+
+    log.debug({"event_type": "append_change_feed_complete", "first_seq": records[0]['seq'], "last_seq": records[-1]['seq'], "segment_path": active_segment_path})
+
+    return records
+
+
+def read_changes(config: dict[str, object], since_seq: int=0) -> Iterator[dict[str, object]]:
+    """
+    Read the change feed from an offset. Segments that only contain earlier
+    records are not opened. Records are returned in sequence order; duplicates
+    left by an interrupted compaction are skipped.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param since_seq: Only return records with a sequence number greater than this.
+    :type since_seq: int
+    :return: Change records, in order. Keys: ['seq', 'timestamp', 'sequencing_run_id', 'action', 'artifact_kinds']
+    :rtype: Iterator[dict[str, object]]
+    """
+    segments = list_segments(config)
+    last_seq = since_seq
+    for index, (first_seq, segment_path) in enumerate(segments):
+        next_first_seq = segments[index + 1][0] if index + 1 < len(segments) else None
+        if next_first_seq is not None and next_first_seq <= since_seq + 1:
+            continue
+        for record in read_segment(segment_path):
+            if record['seq'] > last_seq:
+                last_seq = record['seq']
+                yield record
@@ -1,9 +1,85 @@
+import collections.abc
 import json
 import csv
 import logging
+import os
 
 log = logging.getLogger(__name__)
 
+# Reference tables that have already been loaded, so that they don't need to be
+# re-read each time the config is reloaded. Keys are (loader name, file path),
+# values are (file modification time, table).
+_reference_table_cache = {}
+
+
+class LazyReferenceTable:
+    """
+    A reference table (eg. excluded runs, projects, known species) that is only
+    read from its file the first time it is used. Tables are cached between config
+    reloads, and re-read if their file has been modified. Use `LazyReferenceMapping`
+    for tables that are loaded as a dict, and `LazyReferenceSet` for tables that
+    are loaded as a set.
+    """
+
+    def __init__(self, loader, config, path_key):
+        """
+        :param loader: Function that reads the table, given the config.
+        :type loader: Callable[[dict[str, object]], Union[dict, set]]
+        :param config: Application config.
+        :type config: dict[str, object]
+        :param path_key: Config key for the path to the table's file.
+        :type path_key: str
+        """
+        self._loader = loader
+        self._config = config
+        self._path_key = path_key
+        self._table = None
+
+    def _load(self):
+        if self._table is None:
+            path = self._config[self._path_key]
+            mtime = os.stat(path).st_mtime_ns
+            cache_key = (self._loader.__name__, path)
+            cached = _reference_table_cache.get(cache_key, None)
+            if cached is not None and cached[0] == mtime:
+                self._table = cached[1]
+            else:
+                self._table = self._loader(self._config)
+                _reference_table_cache[cache_key] = (mtime, self._table)
+                log.debug({"event_type": "reference_table_loaded", "config_key": self._path_key, "path": path})
+
+        return self._table
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+
+class LazyReferenceMapping(LazyReferenceTable, collections.abc.Mapping):
+    """
+    A lazily-loaded reference table that is loaded as a dict (eg. projects, known species).
+    """
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+
+class LazyReferenceSet(LazyReferenceTable, collections.abc.Set):
+    """
+    A lazily-loaded reference table that is loaded as a set (eg. excluded runs).
+    """
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # Results of set operations (eg. `&`, `|`) are plain sets.
+        return set(iterable)
+
+
 def get_excluded_runs(config):
     """
     """
@@ -102,25 +178,24 @@ def get_known_species(config):
 
 def load_config(config_path: str) -> dict[str, object]:
     """
+    Load the config file. Reference tables ('excluded_runs', 'projects',
+    'known_species') are read from their files when they are first used.
     """
     with open(config_path, 'r') as f:
         config = json.load(f)
 
     if 'excluded_runs_list' in config:
-        excluded_runs = get_excluded_runs(config)
-        config['excluded_runs'] = excluded_runs
+        config['excluded_runs'] = LazyReferenceSet(get_excluded_runs, config, 'excluded_runs_list')
     else:
         config['excluded_runs'] = set()
 
     if 'projects_definition_file' in config:
-        projects = get_projects(config)
-        config['projects'] = projects
+        config['projects'] = LazyReferenceMapping(get_projects, config, 'projects_definition_file')
     else:
         config['projects'] = {}
 
     if 'known_species_list' in config:
-        known_species = get_known_species(config)
-        config['known_species'] = known_species
+        config['known_species'] = LazyReferenceMapping(get_known_species, config, 'known_species_list')
     else:
         config['known_species'] = {}
 
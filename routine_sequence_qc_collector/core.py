@@ -1,19 +1,64 @@
 import collections
 import csv
+import datetime
+import fnmatch
 import glob
 import json
 import logging
 import os
 import re
-import shutil
+import threading
 
-from typing import Iterator, Optional
+from typing import Callable, Iterator, Optional
 
+import routine_sequence_qc_collector.changes as changes
+import routine_sequence_qc_collector.failures as failures
+import routine_sequence_qc_collector.locking as locking
 import routine_sequence_qc_collector.parsers as parsers
 import routine_sequence_qc_collector.instrument as instrument
 
 log = logging.getLogger(__name__)
 
+# Artifacts with these statuses will be (re-)collected.
+PENDING_ARTIFACT_STATUSES = set(['missing', 'stale', 'forced'])
+
+OUTPUT_SUBDIRS = [
+    'multiqc',
+    'fastqc',
+    'library-qc',
+    'species-abundance',
+    'bracken-species-abundances',
+]
+
+THROUGHPUT_HISTORY_FILENAME = 'collection_throughput.json'
+IN_PROGRESS_RUNS_FILENAME = 'in_progress_runs.json'
+
+# Artifacts that are produced per-library, and can be collected before the
+# analysis is complete when 'progressive_collection' is enabled.
+PER_LIBRARY_ARTIFACT_KINDS = set(['bracken_abundances', 'fastqc'])
+THROUGHPUT_HISTORY_MAX_ENTRIES = 50
+
+# Runs may be collected in parallel, so updates to the throughput history and
+# in-progress runs files are serialized. Other processes are excluded by lock files.
+throughput_history_lock = threading.Lock()
+in_progress_runs_lock = threading.Lock()
+
+# Metrics that are added to the library QC output for each read (R1, R2) of each library.
+FASTQC_METRICS = [
+    'total_sequences',
+    'percent_gc',
+    'percent_duplicates',
+    'max_percent_adapter_content',
+]
+
+# MultiQC general stats columns (see `parsers.parse_multiqc_general_stats`) that are used
+# for the FastQC metrics of reads whose `fastqc_data.txt` is unavailable.
+FASTQC_METRIC_BY_MULTIQC_GENERAL_STATS_COLUMN = {
+    'fastqc-total_sequences': 'total_sequences',
+    'fastqc-percent_gc': 'percent_gc',
+    'fastqc-percent_duplicates': 'percent_duplicates',
+}
+
 def create_output_dirs(config):
     """
     Create output directories if they don't exist.
@@ -24,19 +69,87 @@ def create_output_dirs(config):
     :rtype: None
     """
     base_outdir = config['output_dir']
-    output_dirs = [
-        base_outdir,
-        os.path.join(base_outdir, 'multiqc'),
-        os.path.join(base_outdir, 'fastqc'),
-        os.path.join(base_outdir, 'library-qc'),
-        os.path.join(base_outdir, 'species-abundance'),
-        os.path.join(base_outdir, 'bracken-species-abundances'),
-    ]
+    output_dirs = [base_outdir] + [os.path.join(base_outdir, output_subdir) for output_subdir in OUTPUT_SUBDIRS]
     for output_dir in output_dirs:
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)    
 
 
+def get_run_output_paths(config: dict[str, object], run_id: str) -> list[str]:
+    """
+    Get the paths to all outputs that are collected for a run. Paths may not exist.
+    Directories hold per-library outputs, and are listed after files.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :return: Paths to the run's collected outputs.
+    :rtype: list[str]
+    """
+    base_outdir = config['output_dir']
+    run_output_paths = [
+        os.path.join(base_outdir, 'multiqc', run_id + '_multiqc.html'),
+        os.path.join(base_outdir, 'library-qc', run_id + '_library_qc.json'),
+        os.path.join(base_outdir, 'species-abundance', run_id + '_species_abundance.json'),
+        os.path.join(base_outdir, 'bracken-species-abundances', run_id + '_bracken_species_abundance_matrix.json.gz'),
+        os.path.join(base_outdir, 'fastqc', run_id),
+        os.path.join(base_outdir, 'bracken-species-abundances', run_id),
+    ]
+
+    return run_output_paths
+
+
+def get_retention_cutoff_date(retention_months: int, today: Optional[datetime.date]=None) -> datetime.date:
+    """
+    Get the earliest run date that is within a retention period.
+
+    :param retention_months: Length of the retention period, in months.
+    :type retention_months: int
+    :param today: Date that the retention period ends. Default: today.
+    :type today: Optional[datetime.date]
+    :return: Earliest run date within the retention period.
+    :rtype: datetime.date
+    """
+    if today is None:
+        today = datetime.date.today()
+    months_since_year_zero = today.year * 12 + (today.month - 1) - retention_months
+    year, month_index = divmod(months_since_year_zero, 12)
+    month = month_index + 1
+    # Clamp the day for shorter months (eg. 31st of March -> 28th of February)
+    day = today.day
+    while True:
+        try:
+            cutoff_date = datetime.date(year, month, day)
+            break
+        except ValueError as e:
+            day -= 1
+
+    return cutoff_date
+
+
+def is_within_retention_period(config: dict[str, object], run_id: str) -> bool:
+    """
+    Determine whether a run is within the retention period set by the 'retention_months' config key.
+    If no retention period is configured, or the run date can't be determined, the run is retained.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :return: Whether the run is within the retention period.
+    :rtype: bool
+    """
+    retention_months = config.get('retention_months', None)
+    if not retention_months:
+        return True
+    run_date = instrument.get_run_date(run_id)
+    if run_date is None:
+        return True
+
+    return run_date >= get_retention_cutoff_date(int(retention_months))
+
+
 def find_latest_routine_sequence_qc_output(analysis_dir):
     """
     Find the latest routine sequence QC output directory, for a given run's analysis directory.
@@ -55,7 +168,80 @@ def find_latest_routine_sequence_qc_output(analysis_dir):
     return latest_routine_sequence_qc_output_dir
 
 
-def find_analysis_dirs(config, check_complete=True):
+def check_analysis_dir(config: dict[str, object], run_id: str, analysis_dir_path: str, is_directory: Optional[bool]=None, check_complete: bool=True, failure_registry: Optional[dict[str, dict[str, object]]]=None) -> Optional[dict[str, str]]:
+    """
+    Check whether an analysis directory is ready to be collected.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param analysis_dir_path: Path to the analysis directory for the run.
+    :type analysis_dir_path: str
+    :param is_directory: Whether the path is a directory, if already known.
+    :type is_directory: Optional[bool]
+    :param check_complete: Check if analysis is complete.
+    :type check_complete: bool
+    :param failure_registry: Runs that have failed collection, indexed by run ID. Quarantined runs are skipped.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
+    :return: Analysis directory, or None if it isn't ready to be collected. Keys: ['path', 'instrument_type', 'analysis_complete']
+    :rtype: Optional[dict[str, object]]
+    """
+    if is_directory is None:
+        is_directory = os.path.isdir(analysis_dir_path)
+    instrument_type = instrument.determine_instrument_type(run_id)
+    not_excluded = run_id not in config['excluded_runs']
+    within_retention_period = is_within_retention_period(config, run_id)
+    quarantined = failures.is_quarantined(failure_registry, run_id)
+    ready_to_collect = False
+    routine_sequence_qc_analysis_complete = True
+    if quarantined:
+        # Runs that failed recently aren't probed, they are skipped anyway.
+        ready_to_collect = False
+    elif check_complete:
+        latest_routine_sequence_qc_output = find_latest_routine_sequence_qc_output(analysis_dir_path)
+        if latest_routine_sequence_qc_output is not None and os.path.exists(latest_routine_sequence_qc_output):
+            routine_sequence_qc_analysis_complete = os.path.exists(os.path.join(latest_routine_sequence_qc_output, 'pipeline_complete.json'))
+            # With progressive collection, per-library outputs are collected while the analysis is still running.
+            ready_to_collect = routine_sequence_qc_analysis_complete or bool(config.get('progressive_collection', False))
+    else:
+        ready_to_collect = True
+
+    conditions_checked = {
+        "is_directory": is_directory,
+        "supported_run_id_format": instrument_type != "unknown",
+        "not_excluded": not_excluded,
+        "within_retention_period": within_retention_period,
+        "not_quarantined": not quarantined,
+        "ready_to_collect": ready_to_collect,
+    }
+    conditions_met = list(conditions_checked.values())
+
+    analysis_directory_path = os.path.abspath(analysis_dir_path)
+    analysis_dir = {
+        "path": analysis_directory_path,
+        "instrument_type": instrument_type,
+        "analysis_complete": routine_sequence_qc_analysis_complete,
+    }
+    if all(conditions_met):
+        log.info({
+            "event_type": "analysis_directory_found",
+            "sequencing_run_id": run_id,
+            "analysis_directory_path": analysis_directory_path,
+            "analysis_complete": routine_sequence_qc_analysis_complete,
+        })
+
+        return analysis_dir
+    else:
+        log.debug({
+            "event_type": "directory_skipped",
+            "analysis_directory_path": analysis_directory_path,
+            "conditions_checked": conditions_checked
+        })
+        return None
+
+
+def find_analysis_dirs(config, check_complete=True, failure_registry=None):
     """
     Find all analysis directories.
 
@@ -63,6 +249,8 @@ def find_analysis_dirs(config, check_complete=True):
     :type config: dict[str, object]
     :param check_complete: Check if analysis is complete.
     :type check_complete: bool
+    :param failure_registry: Runs that have failed collection, indexed by run ID. Quarantined runs are skipped.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
     :return: Analysis directory.
     :rtype: Iterator[Optional[dict[str, str]]]
     """
@@ -70,46 +258,50 @@ def find_analysis_dirs(config, check_complete=True):
     subdirs = os.scandir(analysis_by_run_dir)
     
     for subdir in subdirs:
-        run_id = subdir.name
-        instrument_type = instrument.determine_instrument_type(run_id)
-        not_excluded = run_id not in config['excluded_runs']
-        ready_to_collect = False
-        if check_complete:
-            latest_routine_sequence_qc_output = find_latest_routine_sequence_qc_output(subdir)
-            if latest_routine_sequence_qc_output is not None and os.path.exists(latest_routine_sequence_qc_output):
-                routine_sequence_qc_analysis_complete = os.path.exists(os.path.join(latest_routine_sequence_qc_output, 'pipeline_complete.json'))
-                ready_to_collect = routine_sequence_qc_analysis_complete
-        else:
-            ready_to_collect = True
+        yield check_analysis_dir(config, subdir.name, subdir.path, is_directory=subdir.is_dir(), check_complete=check_complete, failure_registry=failure_registry)
 
-        conditions_checked = {
-            "is_directory": subdir.is_dir(),
-            "supported_run_id_format": instrument_type != "unknown",
-            "not_excluded": not_excluded,
-            "ready_to_collect": ready_to_collect,
-        }
-        conditions_met = list(conditions_checked.values())
 
-        analysis_directory_path = os.path.abspath(subdir.path)
-        analysis_dir = {
-            "path": analysis_directory_path,
-            "instrument_type": instrument_type,
-        }
-        if all(conditions_met):
-            log.info({
-                "event_type": "analysis_directory_found",
-                "sequencing_run_id": run_id,
-                "analysis_directory_path": analysis_directory_path
-            })
+def select_analysis_dirs(config: dict[str, object], run_ids: Optional[list[str]]=None, run_id_glob: Optional[str]=None, start_date: Optional[datetime.date]=None, end_date: Optional[datetime.date]=None) -> Iterator[Optional[dict[str, str]]]:
+    """
+    Find the analysis directories for a selection of runs. Runs are selected by
+    run ID, by a glob pattern matched against the run ID, and/or by the run date
+    that is encoded in the run ID. When more than one criterion is given, runs
+    must match all of them. If no run IDs are given, the analysis_by_run_dir is
+    listed once to find candidate runs.
 
-            yield analysis_dir
-        else:
-            log.debug({
-                "event_type": "directory_skipped",
-                "analysis_directory_path": os.path.abspath(subdir.path),
-                "conditions_checked": conditions_checked
-            })
-            yield None
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_ids: Run IDs to select.
+    :type run_ids: Optional[list[str]]
+    :param run_id_glob: Glob pattern (eg. '2401*_M*') that run IDs must match.
+    :type run_id_glob: Optional[str]
+    :param start_date: Earliest run date to select (inclusive).
+    :type start_date: Optional[datetime.date]
+    :param end_date: Latest run date to select (inclusive).
+    :type end_date: Optional[datetime.date]
+    :return: Analysis directory, or None if a selected run isn't ready to be collected.
+    :rtype: Iterator[Optional[dict[str, str]]]
+    """
+    analysis_by_run_dir = config['analysis_by_run_dir']
+    if run_ids:
+        # Each run is selected once, even if its ID is given more than once,
+        # so that it isn't collected by more than one worker at a time.
+        candidate_run_ids = list(dict.fromkeys(run_ids))
+    else:
+        candidate_run_ids = sorted(os.listdir(analysis_by_run_dir))
+
+    for run_id in candidate_run_ids:
+        if run_id_glob is not None and not fnmatch.fnmatchcase(run_id, run_id_glob):
+            continue
+        if start_date is not None or end_date is not None:
+            run_date = instrument.get_run_date(run_id)
+            if run_date is None:
+                continue
+            if start_date is not None and run_date < start_date:
+                continue
+            if end_date is not None and run_date > end_date:
+                continue
+        yield check_analysis_dir(config, run_id, os.path.join(analysis_by_run_dir, run_id))
 
             
 def find_runs(config):
@@ -118,11 +310,14 @@ def find_runs(config):
 
     :param config: Application config.
     :type config: dict[str, object]
-    :return: List of runs. Keys: ['run_id', 'instrument_type']
-    :rtype: list[dict[str, str]]
+    :return: List of runs. Keys: ['run_id', 'instrument_type', 'run_qc_check', 'provisional']. Provisional runs also have 'collection_progress'.
+    :rtype: list[dict[str, object]]
     """
     log.info({"event_type": "find_runs_start"})
     runs = []
+    in_progress_runs = {}
+    if config.get('progressive_collection', False):
+        in_progress_runs = load_in_progress_runs(config)
     all_analysis_dirs = sorted(list(os.listdir(config['analysis_by_run_dir'])))
     all_run_ids = list(filter(instrument.matches_a_valid_run_id_regex, all_analysis_dirs))
 
@@ -130,6 +325,9 @@ def find_runs(config):
         if run_id in config['excluded_runs']:
             continue
 
+        if not is_within_retention_period(config, run_id):
+            continue
+
         instrument_type = instrument.determine_instrument_type(run_id)
         analysis_dir = os.path.join(config['analysis_by_run_dir'], run_id)
         latest_routine_sequence_qc_output_dir = find_latest_routine_sequence_qc_output(analysis_dir)
@@ -148,7 +346,21 @@ def find_runs(config):
                 'run_qc_check': {
                     'checked_metrics': check_metrics,
                     'overall_qc_pass_fail': qc_check_info.get('overall_pass_fail', None),
-                }
+                },
+                'provisional': False,
+            }
+            runs.append(run)
+        elif run_id in in_progress_runs:
+            # Analysis is still running, but some per-library outputs have been collected.
+            run = {
+                'run_id': run_id,
+                'instrument_type': instrument_type,
+                'run_qc_check': {
+                    'checked_metrics': check_metrics,
+                    'overall_qc_pass_fail': qc_check_info.get('overall_pass_fail', None),
+                },
+                'provisional': True,
+                'collection_progress': in_progress_runs[run_id],
             }
             runs.append(run)
 
@@ -157,17 +369,19 @@ def find_runs(config):
     return runs
 
 
-def scan(config: dict[str, object]) -> Iterator[Optional[dict[str, str]]]:
+def scan(config: dict[str, object], failure_registry: Optional[dict[str, dict[str, object]]]=None) -> Iterator[Optional[dict[str, str]]]:
     """
     Scanning involves looking for all existing runs and...
 
     :param config: Application config.
     :type config: dict[str, object]
+    :param failure_registry: Runs that have failed collection, indexed by run ID. Quarantined runs are skipped.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
     :return: A run directory to analyze, or None
     :rtype: Iterator[Optional[dict[str, object]]]
     """
     log.info({"event_type": "scan_start"})
-    for analysis_dir in find_analysis_dirs(config):    
+    for analysis_dir in find_analysis_dirs(config, failure_registry=failure_registry):
         yield analysis_dir
 
 
@@ -225,44 +439,29 @@ def get_percent_reads_by_species_name(species_abundance, species_name):
 
     return percent_reads        
     
-    
-def collect_outputs(config: dict[str, object], analysis_dir: Optional[dict[str, str]]):
+
+
+def parse_samplesheet_libraries(config: dict[str, object], run_id: str, parsed_samplesheet_src_file: str, instrument_type: str) -> Optional[dict[str, dict[str, object]]]:
     """
-    Collect all routine sequence QC outputs for a specific analysis dir.
+    Parse the libraries for a run from its parsed SampleSheet.
 
     :param config: Application config.
     :type config: dict[str, object]
-    :param analysis_dir: Analysis dir. Keys: ['path', 'instrument_type']
-    :type analysis_dir: dict[str, str]
-    :return: None
-    :rtype: None
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param parsed_samplesheet_src_file: Path to the parsed SampleSheet (json).
+    :type parsed_samplesheet_src_file: str
+    :param instrument_type: Instrument type. One of: 'miseq', 'nextseq', 'i100'
+    :type instrument_type: str
+    :return: Libraries, indexed by library ID. Keys: ['library_id', 'samplesheet_project_id', 'project_id'], or None if the SampleSheet can't be parsed.
+    :rtype: Optional[dict[str, dict[str, object]]]
     """
-    if not analysis_dir:
-        log.debug({"event_type": "collect_outputs_failed", "analysis_dir": analysis_dir})
-        return None
-
-    run_id = os.path.basename(analysis_dir['path'])
-    log.info({"event_type": "collect_outputs_start", "sequencing_run_id": run_id, "analysis_dir_path": analysis_dir['path']})
-
-    latest_routine_sequence_qc_output_path = find_latest_routine_sequence_qc_output(analysis_dir['path'])
-
-    if not latest_routine_sequence_qc_output_path:
-        log.error({'event_type': 'find_routine_sequence_qc_outdir_failed', 'sequencing_run_id': run_id})
-        return None
-
-    parsed_samplesheet_src_file = os.path.join(latest_routine_sequence_qc_output_path, 'parse_sample_sheet', 'sample_sheet.json')
-    # If we can't find the parsed SampleSheet then we don't have a
-    # Simple way to get Sample IDs and Project IDs. 
-    if not os.path.exists(parsed_samplesheet_src_file):
-        log.error({'event_type': 'find_parsed_samplesheet_failed', 'sequencing_run_id': run_id, 'parsed_samplesheet_path': parsed_samplesheet_src_file})
-        return None
-
     libraries_by_library_id = {}
     with open(parsed_samplesheet_src_file, 'r') as f:
         samplesheet = json.load(f)
-        if analysis_dir['instrument_type'] == 'miseq':
+        if instrument_type == 'miseq':
             samplesheet_key = 'data'
-        elif analysis_dir['instrument_type'] in set(['nextseq', 'i100']):
+        elif instrument_type in set(['nextseq', 'i100']):
             if 'cloud_data' in samplesheet:
                 samplesheet_key = 'cloud_data'
             else:
@@ -312,12 +511,674 @@ def collect_outputs(config: dict[str, object], analysis_dir: Optional[dict[str,
 
             libraries_by_library_id[library_id] = library
 
+    return libraries_by_library_id
+
+
+def stat_file(path: str) -> Optional[os.stat_result]:
+    """
+    :param path: Path to a file.
+    :type path: str
+    :return: Status of the file, or None if it doesn't exist.
+    :rtype: Optional[os.stat_result]
+    """
+    try:
+        return os.stat(path)
+    except FileNotFoundError as e:
+        return None
+
+
+def get_output_status(src_stats: list[Optional[os.stat_result]], dst_stat: Optional[os.stat_result]) -> str:
+    """
+    Determine whether an output file needs to be (re-)created from its source files.
+
+    When an output is written, it is given the modification time of its newest source
+    file (see `set_output_mtime`). So an output is stale if that no longer matches the
+    newest source file. Both times come from the host that wrote the source files, so
+    any clock skew between that host and this one doesn't matter.
+
+    :param src_stats: Status of each source file, or None for sources that don't exist.
+    :type src_stats: list[Optional[os.stat_result]]
+    :param dst_stat: Status of the output file, or None if it doesn't exist.
+    :type dst_stat: Optional[os.stat_result]
+    :return: Status. One of: 'missing', 'stale', 'up_to_date', 'unavailable'
+    :rtype: str
+    """
+    src_mtimes_ns = [src_stat.st_mtime_ns for src_stat in src_stats if src_stat is not None]
+    if dst_stat is None and not src_mtimes_ns:
+        status = 'unavailable'
+    elif dst_stat is None:
+        status = 'missing'
+    elif src_mtimes_ns and max(src_mtimes_ns) != dst_stat.st_mtime_ns:
+        status = 'stale'
+    else:
+        status = 'up_to_date'
+
+    return status
+
+
+def get_artifact_status(src_file: str, dst_file: str) -> tuple[str, Optional[int], Optional[int]]:
+    """
+    Determine whether an output file needs to be (re-)created from its source file.
+    Each file is stat'ed exactly once.
+
+    :param src_file: Path to the source file, in the routine sequence QC output dir.
+    :type src_file: str
+    :param dst_file: Path to the collected output file.
+    :type dst_file: str
+    :return: Status (one of: 'missing', 'stale', 'up_to_date', 'unavailable'), and size in bytes and modification time in nanoseconds of the source file (None if the source doesn't exist).
+    :rtype: tuple[str, Optional[int], Optional[int]]
+    """
+    src_stat = stat_file(src_file)
+    status = get_output_status([src_stat], stat_file(dst_file))
+    if src_stat is None:
+        return status, None, None
+
+    return status, src_stat.st_size, src_stat.st_mtime_ns
+
+
+def set_output_mtime(dst_file: str, src_mtime_ns: Optional[int]):
+    """
+    Give an output file the modification time of its (newest) source file, so that
+    `get_output_status` can tell whether it is up to date.
+
+    :param dst_file: Path to the output file.
+    :type dst_file: str
+    :param src_mtime_ns: Modification time of the source file, in nanoseconds, as planned. If None, the output is left unchanged.
+    :type src_mtime_ns: Optional[int]
+    :return: None
+    :rtype: None
+    """
+    if src_mtime_ns is not None:
+        os.utime(dst_file, ns=(src_mtime_ns, src_mtime_ns))
+
+
+def plan_collection(config: dict[str, object], analysis_dir: Optional[dict[str, str]], force: bool=False, failure_registry: Optional[dict[str, dict[str, object]]]=None) -> Optional[dict[str, object]]:
+    """
+    Determine which outputs need to be collected for a specific analysis dir,
+    without writing anything. The plan can be passed to `collect_outputs`
+    so that the same files don't need to be stat'ed again.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param analysis_dir: Analysis dir. Keys: ['path', 'instrument_type']
+    :type analysis_dir: dict[str, str]
+    :param force: Re-collect outputs that are up to date, if their source file exists.
+    :type force: bool
+    :param failure_registry: Runs that have failed collection, indexed by run ID. Failures are recorded here.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
+    :return: Collection plan. Keys: ['sequencing_run_id', 'analysis_dir', 'routine_sequence_qc_output_path', 'provisional', 'libraries_by_library_id', 'artifacts', 'metrics_sources', 'bytes_to_copy', 'bytes_to_read'], or None if the run can't be collected. Metrics sources are files that are read into the library QC output, but not copied.
+    :rtype: Optional[dict[str, object]]
+    """
+    if not analysis_dir:
+        return None
+
+    run_id = os.path.basename(analysis_dir['path'])
+    # Only per-library outputs are collected for runs that are still being analyzed.
+    provisional = not analysis_dir.get('analysis_complete', True)
+
+    latest_routine_sequence_qc_output_path = find_latest_routine_sequence_qc_output(analysis_dir['path'])
+
+    if not latest_routine_sequence_qc_output_path:
+        log.error({'event_type': 'find_routine_sequence_qc_outdir_failed', 'sequencing_run_id': run_id})
+        failures.record_failure(config, failure_registry, run_id, 'find_routine_sequence_qc_outdir_failed', analysis_dir['path'])
+        return None
+
+    parsed_samplesheet_src_file = os.path.join(latest_routine_sequence_qc_output_path, 'parse_sample_sheet', 'sample_sheet.json')
+    # If we can't find the parsed SampleSheet then we don't have a
+    # Simple way to get Sample IDs and Project IDs.
+    if not os.path.exists(parsed_samplesheet_src_file) and provisional:
+        # The SampleSheet may not have been parsed yet.
+        log.debug({'event_type': 'find_parsed_samplesheet_pending', 'sequencing_run_id': run_id, 'parsed_samplesheet_path': parsed_samplesheet_src_file})
+        return None
+    if not os.path.exists(parsed_samplesheet_src_file):
+        log.error({'event_type': 'find_parsed_samplesheet_failed', 'sequencing_run_id': run_id, 'parsed_samplesheet_path': parsed_samplesheet_src_file})
+        failures.record_failure(config, failure_registry, run_id, 'find_parsed_samplesheet_failed', analysis_dir['path'], latest_routine_sequence_qc_output_path)
+        return None
+
+    libraries_by_library_id = parse_samplesheet_libraries(config, run_id, parsed_samplesheet_src_file, analysis_dir['instrument_type'])
+    if libraries_by_library_id is None:
+        failures.record_failure(config, failure_registry, run_id, 'find_parsed_samplesheet_failed', analysis_dir['path'], latest_routine_sequence_qc_output_path)
+        return None
+
+    artifacts = []
+    def add_artifact(kind, src_file, dst_file, library_id=None, read_type=None):
+        status, src_size_bytes, src_mtime_ns = get_artifact_status(src_file, dst_file)
+        if force and status == 'up_to_date' and src_size_bytes is not None:
+            status = 'forced'
+        artifact = {
+            'kind': kind,
+            'src_file': src_file,
+            'dst_file': dst_file,
+            'status': status,
+            'src_size_bytes': src_size_bytes,
+            'src_mtime_ns': src_mtime_ns,
+        }
+        if library_id is not None:
+            artifact['library_id'] = library_id
+        if read_type is not None:
+            artifact['read_type'] = read_type
+        artifacts.append(artifact)
+
+    output_dir = config['output_dir']
+    add_artifact(
+        'species_abundance',
+        os.path.join(latest_routine_sequence_qc_output_path, 'abundance_top_n', 'top_5_abundances_species.csv'),
+        os.path.join(output_dir, "species-abundance", run_id + "_species_abundance.json"),
+    )
+    for library_id in libraries_by_library_id.keys():
+        add_artifact(
+            'bracken_abundances',
+            os.path.join(latest_routine_sequence_qc_output_path, 'bracken', library_id + '_Species_bracken_abundances_adjusted.tsv'),
+            os.path.join(output_dir, "bracken-species-abundances", run_id, library_id + "_bracken_species_abundances.tsv"),
+            library_id=library_id,
+        )
+    # The abundance matrix is built from all of the per-library bracken
+    # abundances, so it needs to be rebuilt whenever any of them are collected.
+    bracken_abundances_artifacts = [a for a in artifacts if a['kind'] == 'bracken_abundances']
+    bracken_abundance_matrix_dst_file = os.path.join(output_dir, "bracken-species-abundances", run_id + "_bracken_species_abundance_matrix.json.gz")
+    bracken_abundances_available = any(a['src_size_bytes'] is not None for a in bracken_abundances_artifacts)
+    if not bracken_abundances_available:
+        bracken_abundance_matrix_status = 'unavailable' if not os.path.exists(bracken_abundance_matrix_dst_file) else 'up_to_date'
+    elif not os.path.exists(bracken_abundance_matrix_dst_file):
+        bracken_abundance_matrix_status = 'missing'
+    elif any(a['status'] in ['missing', 'stale'] for a in bracken_abundances_artifacts):
+        bracken_abundance_matrix_status = 'stale'
+    elif force:
+        bracken_abundance_matrix_status = 'forced'
+    else:
+        bracken_abundance_matrix_status = 'up_to_date'
+    # Count the bracken abundances that need to be read to build the matrix,
+    # but aren't already being copied.
+    bracken_abundance_matrix_src_size_bytes = None
+    if bracken_abundances_available:
+        bracken_abundance_matrix_src_size_bytes = sum(a['src_size_bytes'] for a in bracken_abundances_artifacts if a['src_size_bytes'] is not None and a['status'] not in PENDING_ARTIFACT_STATUSES)
+    artifacts.append({
+        'kind': 'bracken_abundance_matrix',
+        'src_file': os.path.join(latest_routine_sequence_qc_output_path, 'bracken'),
+        'dst_file': bracken_abundance_matrix_dst_file,
+        'status': bracken_abundance_matrix_status,
+        'src_size_bytes': bracken_abundance_matrix_src_size_bytes,
+        'src_mtime_ns': None,
+    })
+    # FastQC and MultiQC metrics are read into the library QC output rather than
+    # copied, so it needs to be re-written whenever any of them change.
+    metrics_sources = []
+    metrics_src_stats = []
+    def add_metrics_source(kind, src_file, library_id=None, read_type=None):
+        src_stat = stat_file(src_file)
+        metrics_source = {
+            'kind': kind,
+            'src_file': src_file,
+            'status': None,
+            'src_size_bytes': src_stat.st_size if src_stat is not None else None,
+        }
+        if library_id is not None:
+            metrics_source['library_id'] = library_id
+        if read_type is not None:
+            metrics_source['read_type'] = read_type
+        metrics_sources.append(metrics_source)
+        metrics_src_stats.append(src_stat)
+
+    for library_id in libraries_by_library_id.keys():
+        for read_type in ['R1', 'R2']:
+            add_metrics_source(
+                'fastqc_data',
+                os.path.join(latest_routine_sequence_qc_output_path, 'fastqc', '_'.join([library_id, read_type, 'fastqc']), 'fastqc_data.txt'),
+                library_id=library_id,
+                read_type=read_type,
+            )
+    add_metrics_source(
+        'multiqc_general_stats',
+        os.path.join(latest_routine_sequence_qc_output_path, 'multiqc', 'multiqc_data', 'multiqc_general_stats.txt'),
+    )
+
+    library_qc_src_file = os.path.join(latest_routine_sequence_qc_output_path, 'basic_qc_stats', 'basic_qc_stats.csv')
+    library_qc_dst_file = os.path.join(output_dir, "library-qc", run_id + "_library_qc.json")
+    library_qc_src_stats = [stat_file(library_qc_src_file)] + metrics_src_stats
+    library_qc_status = get_output_status(library_qc_src_stats, stat_file(library_qc_dst_file))
+    library_qc_src_mtimes_ns = [src_stat.st_mtime_ns for src_stat in library_qc_src_stats if src_stat is not None]
+    if force and library_qc_status == 'up_to_date' and library_qc_src_mtimes_ns:
+        library_qc_status = 'forced'
+    artifacts.append({
+        'kind': 'library_qc',
+        'src_file': library_qc_src_file,
+        'dst_file': library_qc_dst_file,
+        'status': library_qc_status,
+        'src_size_bytes': library_qc_src_stats[0].st_size if library_qc_src_stats[0] is not None else None,
+        'src_mtime_ns': max(library_qc_src_mtimes_ns) if library_qc_src_mtimes_ns else None,
+    })
+    # All of the available metrics sources are read whenever the library QC output is written.
+    for metrics_source in metrics_sources:
+        metrics_source['status'] = library_qc_status if metrics_source['src_size_bytes'] is not None else 'unavailable'
+
+    for library_id in libraries_by_library_id.keys():
+        for read_type in ['R1', 'R2']:
+            add_artifact(
+                'fastqc',
+                os.path.join(latest_routine_sequence_qc_output_path, 'fastqc', '_'.join([library_id, read_type, 'fastqc']), 'fastqc_report.html'),
+                os.path.join(output_dir, "fastqc", run_id, '_'.join([library_id, read_type, 'fastqc.html'])),
+                library_id=library_id,
+                read_type=read_type,
+            )
+    add_artifact(
+        'multiqc',
+        os.path.join(latest_routine_sequence_qc_output_path, 'multiqc', 'multiqc_report.html'),
+        os.path.join(output_dir, "multiqc", run_id + "_multiqc.html"),
+    )
+
+    if provisional:
+        artifacts = [a for a in artifacts if a['kind'] in PER_LIBRARY_ARTIFACT_KINDS]
+        metrics_sources = []
+
+    bytes_to_copy = sum(a['src_size_bytes'] for a in artifacts if a['status'] in PENDING_ARTIFACT_STATUSES)
+    bytes_to_read = sum(m['src_size_bytes'] for m in metrics_sources if m['status'] in PENDING_ARTIFACT_STATUSES)
+
+    plan = {
+        'sequencing_run_id': run_id,
+        'analysis_dir': analysis_dir,
+        'routine_sequence_qc_output_path': latest_routine_sequence_qc_output_path,
+        'provisional': provisional,
+        'libraries_by_library_id': libraries_by_library_id,
+        'artifacts': artifacts,
+        'metrics_sources': metrics_sources,
+        'bytes_to_copy': bytes_to_copy,
+        'bytes_to_read': bytes_to_read,
+    }
+
+    return plan
+
+
+def summarize_plan(plan: dict[str, object]) -> dict[str, object]:
+    """
+    Prepare a collection plan for reporting, dropping the parsed SampleSheet details.
+
+    :param plan: Collection plan, as returned by `plan_collection`.
+    :type plan: dict[str, object]
+    :return: Plan summary. Keys: ['sequencing_run_id', 'routine_sequence_qc_output_path', 'provisional', 'num_libraries', 'artifact_counts_by_status', 'bytes_to_copy', 'bytes_to_read', 'artifacts', 'metrics_sources']
+    :rtype: dict[str, object]
+    """
+    artifact_counts_by_status = collections.Counter(a['status'] for a in plan['artifacts'])
+    summary = {
+        'sequencing_run_id': plan['sequencing_run_id'],
+        'routine_sequence_qc_output_path': plan['routine_sequence_qc_output_path'],
+        'provisional': plan['provisional'],
+        'num_libraries': len(plan['libraries_by_library_id']),
+        'artifact_counts_by_status': dict(artifact_counts_by_status),
+        'bytes_to_copy': plan['bytes_to_copy'],
+        'bytes_to_read': plan['bytes_to_read'],
+        'artifacts': plan['artifacts'],
+        'metrics_sources': plan['metrics_sources'],
+    }
+
+    return summary
+
+
+def load_throughput_history(config: dict[str, object]) -> list[dict[str, object]]:
+    """
+    Load the record of recent collections, used to estimate collection throughput.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: Recent collections. Keys: ['timestamp', 'sequencing_run_id', 'bytes_copied', 'duration_seconds']
+    :rtype: list[dict[str, object]]
+    """
+    throughput_history_file = os.path.join(config['output_dir'], THROUGHPUT_HISTORY_FILENAME)
+    throughput_history = []
+    if os.path.exists(throughput_history_file):
+        try:
+            with open(throughput_history_file, 'r') as f:
+                throughput_history = json.load(f)
+        except json.decoder.JSONDecodeError as e:
+            log.warning({'event_type': 'load_throughput_history_failed', 'throughput_history_file': throughput_history_file})
+
+    return throughput_history
+
+
+def record_throughput(config: dict[str, object], run_id: str, bytes_copied: int, duration_seconds: float):
+    """
+    Add a collection to the record of recent collections. Only the most
+    recent `THROUGHPUT_HISTORY_MAX_ENTRIES` collections are kept.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param bytes_copied: Number of bytes read from the routine sequence QC output dir.
+    :type bytes_copied: int
+    :param duration_seconds: Time taken to collect outputs.
+    :type duration_seconds: float
+    :return: None
+    :rtype: None
+    """
+    throughput_history_file = os.path.join(config['output_dir'], THROUGHPUT_HISTORY_FILENAME)
+    with throughput_history_lock, locking.file_lock(throughput_history_file + '.lock'):
+        throughput_history = load_throughput_history(config)
+        throughput_history.append({
+            'timestamp': datetime.datetime.now().isoformat(),
+            'sequencing_run_id': run_id,
+            'bytes_copied': bytes_copied,
+            'duration_seconds': duration_seconds,
+        })
+        throughput_history = throughput_history[-THROUGHPUT_HISTORY_MAX_ENTRIES:]
+        locking.write_json_atomic(throughput_history_file, throughput_history, indent=2)
+
+
+def estimate_throughput_bytes_per_second(config: dict[str, object]) -> Optional[float]:
+    """
+    Estimate collection throughput from recent collections.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: Estimated throughput in bytes per second, or None if there are no recent collections.
+    :rtype: Optional[float]
+    """
+    throughput_history = load_throughput_history(config)
+    total_bytes_copied = sum(c['bytes_copied'] for c in throughput_history)
+    total_duration_seconds = sum(c['duration_seconds'] for c in throughput_history)
+    if total_bytes_copied == 0 or total_duration_seconds <= 0:
+        return None
+
+    return total_bytes_copied / total_duration_seconds
+
+
+def load_in_progress_runs(config: dict[str, object]) -> dict[str, dict[str, object]]:
+    """
+    Load the collection progress of runs whose analysis is still in progress.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: Collection progress, indexed by run ID. Keys: ['num_libraries', 'num_fastqc_reports_collected', 'num_fastqc_reports_expected', 'num_bracken_abundances_collected', 'num_bracken_abundances_expected', 'last_collected_timestamp']
+    :rtype: dict[str, dict[str, object]]
+    """
+    in_progress_runs_file = os.path.join(config['output_dir'], IN_PROGRESS_RUNS_FILENAME)
+    in_progress_runs = {}
+    if os.path.exists(in_progress_runs_file):
+        try:
+            with open(in_progress_runs_file, 'r') as f:
+                in_progress_runs = json.load(f)
+        except json.decoder.JSONDecodeError as e:
+            log.warning({'event_type': 'load_in_progress_runs_failed', 'in_progress_runs_file': in_progress_runs_file})
+
+    return in_progress_runs
+
+
+def update_in_progress_runs(config: dict[str, object], update: Callable[[dict[str, dict[str, object]]], bool]):
+    """
+    Apply an update to the in-progress runs file. The file is re-loaded under a lock, so
+    that updates made by other processes aren't lost, and it is only re-written if the
+    update changed it.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param update: Function that updates the freshly-loaded in-progress runs in place, and returns whether they changed.
+    :type update: Callable[[dict[str, dict[str, object]]], bool]
+    :return: None
+    :rtype: None
+    """
+    in_progress_runs_file = os.path.join(config['output_dir'], IN_PROGRESS_RUNS_FILENAME)
+    with in_progress_runs_lock, locking.file_lock(in_progress_runs_file + '.lock'):
+        in_progress_runs = load_in_progress_runs(config)
+        if update(in_progress_runs):
+            locking.write_json_atomic(in_progress_runs_file, in_progress_runs, indent=2)
+
+
+def update_in_progress_run(config: dict[str, object], run_id: str, collection_progress: Optional[dict[str, object]]):
+    """
+    Update the collection progress for a run whose analysis is still in progress.
+    When removing a run, the file is only re-written if the run was in progress.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param collection_progress: Collection progress, or None to remove the run once it has been finalized.
+    :type collection_progress: Optional[dict[str, object]]
+    :return: None
+    :rtype: None
+    """
+    if collection_progress is None:
+        remove_in_progress_runs(config, [run_id])
+        return None
+
+    def set_collection_progress(in_progress_runs):
+        in_progress_runs[run_id] = collection_progress
+        return True
+
+    update_in_progress_runs(config, set_collection_progress)
+
+
+def remove_in_progress_runs(config: dict[str, object], run_ids: list[str]):
+    """
+    Remove runs from the in-progress runs file, if present (eg. once they have been finalized or pruned).
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_ids: Sequencing run IDs.
+    :type run_ids: list[str]
+    :return: None
+    :rtype: None
+    """
+    def remove_runs(in_progress_runs):
+        changed = False
+        for run_id in run_ids:
+            if in_progress_runs.pop(run_id, None) is not None:
+                changed = True
+        return changed
+
+    update_in_progress_runs(config, remove_runs)
+
+
+def collect_provisional_outputs(config: dict[str, object], plan: dict[str, object]) -> dict[str, object]:
+    """
+    Collect the per-library outputs (FastQC reports, bracken abundances) that are
+    available for a run whose analysis is still in progress. Run-level outputs
+    are collected once the analysis is complete.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param plan: Provisional collection plan, as returned by `plan_collection`.
+    :type plan: dict[str, object]
+    :return: The collection plan that was carried out.
+    :rtype: dict[str, object]
+    """
+    import shutil
+
+    run_id = plan['sequencing_run_id']
+    collect_start_timestamp = datetime.datetime.now()
+    for output_subdir in ['fastqc', 'bracken-species-abundances']:
+        os.makedirs(os.path.join(config['output_dir'], output_subdir, run_id), exist_ok=True)
+
+    updated_artifact_kinds = set()
+    num_collected_by_kind = collections.Counter()
+    num_expected_by_kind = collections.Counter()
+    for artifact in plan['artifacts']:
+        num_expected_by_kind[artifact['kind']] += 1
+        if artifact['status'] in PENDING_ARTIFACT_STATUSES:
+            shutil.copyfile(artifact['src_file'], artifact['dst_file'])
+            set_output_mtime(artifact['dst_file'], artifact['src_mtime_ns'])
+            updated_artifact_kinds.add(artifact['kind'])
+            log.debug({
+                "event_type": "copy_" + artifact['kind'] + "_complete",
+                "run_id": run_id,
+                "src_file": artifact['src_file'],
+                "dst_file": artifact['dst_file'],
+                "provisional": True,
+            })
+        if artifact['status'] != 'unavailable':
+            num_collected_by_kind[artifact['kind']] += 1
+
+    collection_progress = {
+        'num_libraries': len(plan['libraries_by_library_id']),
+        'num_fastqc_reports_collected': num_collected_by_kind['fastqc'],
+        'num_fastqc_reports_expected': num_expected_by_kind['fastqc'],
+        'num_bracken_abundances_collected': num_collected_by_kind['bracken_abundances'],
+        'num_bracken_abundances_expected': num_expected_by_kind['bracken_abundances'],
+        'last_collected_timestamp': collect_start_timestamp.isoformat(),
+    }
+    if updated_artifact_kinds:
+        update_in_progress_run(config, run_id, collection_progress)
+        changes.append_changes(config, [{'sequencing_run_id': run_id, 'action': 'updated', 'artifact_kinds': updated_artifact_kinds}])
+
+    collect_duration_seconds = (datetime.datetime.now() - collect_start_timestamp).total_seconds()
+    if plan['bytes_to_copy'] > 0:
+        record_throughput(config, run_id, plan['bytes_to_copy'], collect_duration_seconds)
+
+    log.info({"event_type": "collect_provisional_outputs_complete", "sequencing_run_id": run_id, **collection_progress})
+
+    return plan
+
+
+def add_fastqc_metrics(run_id: str, libraries_by_library_id: dict[str, dict[str, object]], fastqc_data_sources: list[dict[str, object]], multiqc_general_stats_source: dict[str, object]):
+    """
+    Add FastQC metrics for each read of each library to the library QC records,
+    eg. 'r1_percent_duplicates', 'r2_max_percent_adapter_content'. Metrics are
+    parsed from each read's `fastqc_data.txt`. For reads where that file is
+    unavailable, metrics are taken from the MultiQC general stats instead,
+    which is only read if needed.
+
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param libraries_by_library_id: Library QC records, indexed by library ID. Updated in place.
+    :type libraries_by_library_id: dict[str, dict[str, object]]
+    :param fastqc_data_sources: Planned 'fastqc_data' metrics sources.
+    :type fastqc_data_sources: list[dict[str, object]]
+    :param multiqc_general_stats_source: Planned 'multiqc_general_stats' metrics source.
+    :type multiqc_general_stats_source: dict[str, object]
+    :return: None
+    :rtype: None
+    """
+    multiqc_general_stats_by_sample_name = None
+    for fastqc_data_source in fastqc_data_sources:
+        library_id = fastqc_data_source['library_id']
+        read_type = fastqc_data_source['read_type']
+        fastqc_metrics = dict.fromkeys(FASTQC_METRICS)
+        if fastqc_data_source['src_size_bytes'] is not None:
+            with open(fastqc_data_source['src_file'], 'r') as f:
+                fastqc_metrics = parsers.parse_fastqc_data(f)
+        elif multiqc_general_stats_source['src_size_bytes'] is not None:
+            if multiqc_general_stats_by_sample_name is None:
+                with open(multiqc_general_stats_source['src_file'], 'r') as f:
+                    multiqc_general_stats_by_sample_name = parsers.parse_multiqc_general_stats(f)
+            general_stats = multiqc_general_stats_by_sample_name.get('_'.join([library_id, read_type]), {})
+            for column_name, metric in FASTQC_METRIC_BY_MULTIQC_GENERAL_STATS_COLUMN.items():
+                fastqc_metrics[metric] = general_stats.get(column_name, None)
+            if fastqc_metrics['total_sequences'] is not None:
+                fastqc_metrics['total_sequences'] = int(fastqc_metrics['total_sequences'])
+        else:
+            log.debug({'event_type': 'collect_fastqc_metrics_failed', 'sequencing_run_id': run_id, 'library_id': library_id, 'read_type': read_type})
+        for metric in FASTQC_METRICS:
+            libraries_by_library_id[library_id][read_type.lower() + '_' + metric] = fastqc_metrics[metric]
+
+
+def build_bracken_abundance_matrix(run_id: str, bracken_abundances_by_library_id: dict[str, list[dict[str, object]]]) -> dict[str, object]:
+    """
+    Combine per-library bracken abundances into a sparse (libraries x taxa)
+    matrix in coordinate (COO) format, with a dictionary of taxa. Rows are
+    indexes into 'library_ids' and columns are indexes into 'taxa'. Only
+    non-zero entries are stored. The matrix can be loaded with, for example:
+    `scipy.sparse.coo_matrix((m['fraction_total_reads'], (m['row'], m['col'])), shape=m['shape'])`
+
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param bracken_abundances_by_library_id: Parsed bracken abundances, indexed by library ID.
+    :type bracken_abundances_by_library_id: dict[str, list[dict[str, object]]]
+    :return: Sparse abundance matrix. Keys: ['sequencing_run_id', 'shape', 'library_ids', 'taxa', 'row', 'col', 'new_est_reads', 'fraction_total_reads']
+    :rtype: dict[str, object]
+    """
+    library_ids = sorted(bracken_abundances_by_library_id.keys())
+    taxa = []
+    col_by_taxonomy_id = {}
+    row_indexes = []
+    col_indexes = []
+    new_est_reads = []
+    fraction_total_reads = []
+    for row_index, library_id in enumerate(library_ids):
+        for abundance in bracken_abundances_by_library_id[library_id]:
+            taxonomy_id = abundance['taxonomy_id']
+            if taxonomy_id not in col_by_taxonomy_id:
+                col_by_taxonomy_id[taxonomy_id] = len(taxa)
+                taxa.append({
+                    'taxonomy_id': taxonomy_id,
+                    'name': abundance['name'],
+                    'taxonomy_lvl': abundance['taxonomy_lvl'],
+                })
+            row_indexes.append(row_index)
+            col_indexes.append(col_by_taxonomy_id[taxonomy_id])
+            new_est_reads.append(abundance['new_est_reads'])
+            fraction_total_reads.append(abundance['fraction_total_reads'])
+
+    bracken_abundance_matrix = {
+        'sequencing_run_id': run_id,
+        'shape': [len(library_ids), len(taxa)],
+        'library_ids': library_ids,
+        'taxa': taxa,
+        'row': row_indexes,
+        'col': col_indexes,
+        'new_est_reads': new_est_reads,
+        'fraction_total_reads': fraction_total_reads,
+    }
+
+    return bracken_abundance_matrix
+
+
+def collect_outputs(config: dict[str, object], analysis_dir: Optional[dict[str, str]], plan: Optional[dict[str, object]]=None, failure_registry: Optional[dict[str, dict[str, object]]]=None):
+    """
+    Collect all routine sequence QC outputs for a specific analysis dir.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param analysis_dir: Analysis dir. Keys: ['path', 'instrument_type']
+    :type analysis_dir: dict[str, str]
+    :param plan: Collection plan, as returned by `plan_collection`. If not provided, one is created.
+    :type plan: Optional[dict[str, object]]
+    :param failure_registry: Runs that have failed collection, indexed by run ID. Failures are recorded here, and cleared once the run is fully collected.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
+    :return: The collection plan that was carried out, or None if the outputs couldn't be collected.
+    :rtype: Optional[dict[str, object]]
+    """
+    # Only needed when outputs are collected, so not imported at startup.
+    import gzip
+    import shutil
+
+    if not analysis_dir:
+        log.debug({"event_type": "collect_outputs_failed", "analysis_dir": analysis_dir})
+        return None
+
+    run_id = os.path.basename(analysis_dir['path'])
+    log.info({"event_type": "collect_outputs_start", "sequencing_run_id": run_id, "analysis_dir_path": analysis_dir['path']})
+    collect_start_timestamp = datetime.datetime.now()
+
+    if plan is None:
+        plan = plan_collection(config, analysis_dir, failure_registry=failure_registry)
+    if plan is None:
+        return None
+
+    if plan['provisional']:
+        return collect_provisional_outputs(config, plan)
+
+    libraries_by_library_id = plan['libraries_by_library_id']
+    artifacts_by_kind = collections.defaultdict(list)
+    for artifact in plan['artifacts']:
+        artifacts_by_kind[artifact['kind']].append(artifact)
+    # The species abundance and library QC outputs are always written if they
+    # are out of date, even if their source file is unavailable.
+    [species_abundance_artifact] = artifacts_by_kind['species_abundance']
+    [library_qc_artifact] = artifacts_by_kind['library_qc']
+    write_species_abundance = species_abundance_artifact['status'] != 'up_to_date'
+    write_library_qc = library_qc_artifact['status'] != 'up_to_date'
+    metrics_sources_by_kind = collections.defaultdict(list)
+    for metrics_source in plan['metrics_sources']:
+        metrics_sources_by_kind[metrics_source['kind']].append(metrics_source)
+    if any(m['status'] in PENDING_ARTIFACT_STATUSES for m in plan['metrics_sources']):
+        write_library_qc = True
+
     # species-abundance
     species_abundance_by_library_id = {library_id: {'library_id': library_id, 'project_id': libraries_by_library_id[library_id]['project_id']} for library_id in libraries_by_library_id.keys()}
-    species_abundance_dst_file = os.path.join(config['output_dir'], "species-abundance", run_id + "_species_abundance.json")
-    if not os.path.exists(species_abundance_dst_file):
-        species_abundance_src_file = os.path.join(latest_routine_sequence_qc_output_path, 'abundance_top_n', 'top_5_abundances_species.csv')
-        if os.path.exists(species_abundance_src_file):
+    species_abundance_dst_file = species_abundance_artifact['dst_file']
+    # Species abundances are needed to infer species for the library QC output.
+    if write_species_abundance or write_library_qc:
+        species_abundance_src_file = species_abundance_artifact['src_file']
+        if species_abundance_artifact['src_size_bytes'] is not None:
             with open(species_abundance_src_file, 'r') as f:
                 reader = csv.DictReader(f, dialect='unix')
                 for row in reader:
@@ -336,8 +1197,10 @@ def collect_outputs(config: dict[str, object], analysis_dir: Optional[dict[str,
                                 log.error({'event_type': 'collect_species_abundance_metric_failed', 'metric': fraction_total_reads_key, 'sequencing_run_id': run_id, 'library_id': library_id})
                             species_abundance_by_library_id[library_id][fraction_total_reads_key] = fraction_total_reads
 
+    if write_species_abundance:
         with open(species_abundance_dst_file, 'w') as f:
             json.dump(list(species_abundance_by_library_id.values()), f, indent=2)
+        set_output_mtime(species_abundance_dst_file, species_abundance_artifact['src_mtime_ns'])
 
         log.info({
             "event_type": "write_species_abundance_complete",
@@ -347,25 +1210,54 @@ def collect_outputs(config: dict[str, object], analysis_dir: Optional[dict[str,
 
     if not os.path.exists(os.path.join(config['output_dir'], "bracken-species-abundances", run_id)):
         os.makedirs(os.path.join(config['output_dir'], "bracken-species-abundances", run_id))
-        
-    for library_id in libraries_by_library_id.keys():
-        bracken_abundances_dst_file = os.path.join(config['output_dir'], "bracken-species-abundances", run_id, library_id + "_bracken_species_abundances.tsv")
-        if not os.path.exists(bracken_abundances_dst_file):
-            bracken_abundances_src_file = os.path.join(latest_routine_sequence_qc_output_path, 'bracken', library_id + '_Species_bracken_abundances_adjusted.tsv')
-            if os.path.exists(bracken_abundances_src_file):
-                shutil.copyfile(bracken_abundances_src_file, bracken_abundances_dst_file)
-                log.debug({
-                    "event_type": "copy_bracken_abundances_complete",
-                    "run_id": run_id,
-                    "src_file": bracken_abundances_src_file,
-                    "dst_file": bracken_abundances_dst_file
-                })
+
+    [bracken_abundance_matrix_artifact] = artifacts_by_kind['bracken_abundance_matrix']
+    write_bracken_abundance_matrix = bracken_abundance_matrix_artifact['status'] in PENDING_ARTIFACT_STATUSES
+    bracken_abundances_by_library_id = {}
+    for bracken_abundances_artifact in artifacts_by_kind['bracken_abundances']:
+        bracken_abundances_src_file = bracken_abundances_artifact['src_file']
+        bracken_abundances_dst_file = bracken_abundances_artifact['dst_file']
+        copy_bracken_abundances = bracken_abundances_artifact['status'] in PENDING_ARTIFACT_STATUSES
+        if write_bracken_abundance_matrix and bracken_abundances_artifact['src_size_bytes'] is not None:
+            # Read each file once, both to copy it (unchanged) and to add it to the matrix.
+            with open(bracken_abundances_src_file, 'rb') as f:
+                bracken_abundances_content = f.read()
+            if copy_bracken_abundances:
+                with open(bracken_abundances_dst_file, 'wb') as f:
+                    f.write(bracken_abundances_content)
+            library_id = bracken_abundances_artifact['library_id']
+            bracken_abundances_lines = bracken_abundances_content.decode('utf-8', errors='replace').splitlines()
+            bracken_abundances_by_library_id[library_id] = parsers.parse_bracken_abundances(bracken_abundances_lines)
+        elif copy_bracken_abundances:
+            shutil.copyfile(bracken_abundances_src_file, bracken_abundances_dst_file)
+        if copy_bracken_abundances:
+            set_output_mtime(bracken_abundances_dst_file, bracken_abundances_artifact['src_mtime_ns'])
+            log.debug({
+                "event_type": "copy_bracken_abundances_complete",
+                "run_id": run_id,
+                "src_file": bracken_abundances_src_file,
+                "dst_file": bracken_abundances_dst_file
+            })
+
+    if write_bracken_abundance_matrix:
+        bracken_abundance_matrix_dst_file = bracken_abundance_matrix_artifact['dst_file']
+        bracken_abundance_matrix = build_bracken_abundance_matrix(run_id, bracken_abundances_by_library_id)
+        with gzip.open(bracken_abundance_matrix_dst_file, 'wt') as f:
+            json.dump(bracken_abundance_matrix, f, separators=(',', ':'))
+
+        log.info({
+            "event_type": "write_bracken_abundance_matrix_complete",
+            "run_id": run_id,
+            "num_libraries": len(bracken_abundance_matrix['library_ids']),
+            "num_taxa": len(bracken_abundance_matrix['taxa']),
+            "dst_file": bracken_abundance_matrix_dst_file
+        })
 
     # library-qc
-    library_qc_dst_file = os.path.join(config['output_dir'], "library-qc", run_id + "_library_qc.json")
-    if not os.path.exists(library_qc_dst_file):
-        basic_qc_stats_src_file = os.path.join(latest_routine_sequence_qc_output_path, 'basic_qc_stats', 'basic_qc_stats.csv')
-        if os.path.exists(basic_qc_stats_src_file):
+    library_qc_dst_file = library_qc_artifact['dst_file']
+    if write_library_qc:
+        basic_qc_stats_src_file = library_qc_artifact['src_file']
+        if library_qc_artifact['src_size_bytes'] is not None:
             with open(basic_qc_stats_src_file, 'r') as f:
                 reader = csv.DictReader(f, dialect='unix')
                 for row in reader:
@@ -405,8 +1297,11 @@ def collect_outputs(config: dict[str, object], analysis_dir: Optional[dict[str,
                             log.error({'event_type': 'collect_library_qc_metric_failed', 'metric': 'percent_bases_above_q30', 'sequencing_run_id': run_id, 'library_id': library_id})
                         libraries_by_library_id[library_id]['percent_bases_above_q30'] = percent_bases_above_q30
 
+        add_fastqc_metrics(run_id, libraries_by_library_id, metrics_sources_by_kind['fastqc_data'], metrics_sources_by_kind['multiqc_general_stats'][0])
+
         with open(library_qc_dst_file, 'w') as f:
             json.dump(list(libraries_by_library_id.values()), f, indent=2)
+        set_output_mtime(library_qc_dst_file, library_qc_artifact['src_mtime_ns'])
 
         log.info({
             "event_type": "write_library_qc_complete",
@@ -417,39 +1312,41 @@ def collect_outputs(config: dict[str, object], analysis_dir: Optional[dict[str,
     if not os.path.exists(os.path.join(config['output_dir'], "fastqc", run_id)):
         os.makedirs(os.path.join(config['output_dir'], "fastqc", run_id))
 
-    for library_id in libraries_by_library_id.keys():
-        # fastqc
-        for read_type in ['R1', 'R2']:
-            fastqc_src_file = os.path.join(latest_routine_sequence_qc_output_path, 'fastqc', '_'.join([library_id, read_type, 'fastqc']), 'fastqc_report.html')
-            fastqc_dst_file = os.path.join(config['output_dir'], "fastqc", run_id, '_'.join([library_id, read_type, 'fastqc.html']))
-            if not os.path.exists(fastqc_src_file):
-                log.warning({
-                    "event_type": "copy_fastqc_failed",
-                    "run_id": run_id,
-                    "src_file": fastqc_src_file,
-                    "dst_file": fastqc_dst_file,
-                })
-            if os.path.exists(fastqc_src_file) and not os.path.exists(fastqc_dst_file):
-                shutil.copyfile(fastqc_src_file, fastqc_dst_file)
-                log.debug({
-                    "event_type": "copy_fastqc_complete",
-                    "run_id": run_id,
-                    "src_file": fastqc_src_file,
-                    "dst_file": fastqc_dst_file
-                })
+    # fastqc
+    for fastqc_artifact in artifacts_by_kind['fastqc']:
+        fastqc_src_file = fastqc_artifact['src_file']
+        fastqc_dst_file = fastqc_artifact['dst_file']
+        if fastqc_artifact['src_size_bytes'] is None:
+            log.warning({
+                "event_type": "copy_fastqc_failed",
+                "run_id": run_id,
+                "src_file": fastqc_src_file,
+                "dst_file": fastqc_dst_file,
+            })
+        if fastqc_artifact['status'] in PENDING_ARTIFACT_STATUSES:
+            shutil.copyfile(fastqc_src_file, fastqc_dst_file)
+            set_output_mtime(fastqc_dst_file, fastqc_artifact['src_mtime_ns'])
+            log.debug({
+                "event_type": "copy_fastqc_complete",
+                "run_id": run_id,
+                "src_file": fastqc_src_file,
+                "dst_file": fastqc_dst_file
+            })
 
     # multiqc
-    multiqc_src_file = os.path.join(latest_routine_sequence_qc_output_path, 'multiqc', 'multiqc_report.html')
-    multiqc_dst_file = os.path.join(config['output_dir'], "multiqc", run_id + "_multiqc.html")
-    if not os.path.exists(multiqc_src_file):
+    [multiqc_artifact] = artifacts_by_kind['multiqc']
+    multiqc_src_file = multiqc_artifact['src_file']
+    multiqc_dst_file = multiqc_artifact['dst_file']
+    if multiqc_artifact['src_size_bytes'] is None:
         log.warning({
             "event_type": "copy_multiqc_failed",
             "run_id": run_id,
             "src_file": multiqc_src_file,
             "dst_file": multiqc_dst_file
         })
-    if os.path.exists(multiqc_src_file) and not os.path.exists(multiqc_dst_file):
+    if multiqc_artifact['status'] in PENDING_ARTIFACT_STATUSES:
         shutil.copyfile(multiqc_src_file, multiqc_dst_file)
+        set_output_mtime(multiqc_dst_file, multiqc_artifact['src_mtime_ns'])
         log.info({
             "event_type": "copy_multiqc_complete",
             "run_id": run_id,
@@ -457,5 +1354,32 @@ def collect_outputs(config: dict[str, object], analysis_dir: Optional[dict[str,
             "dst_file": multiqc_dst_file
         })
 
+    collect_duration_seconds = (datetime.datetime.now() - collect_start_timestamp).total_seconds()
+    if plan['bytes_to_copy'] > 0:
+        record_throughput(config, run_id, plan['bytes_to_copy'], collect_duration_seconds)
+
+    # The species abundance and library QC outputs are written whenever they are out of date,
+    # other outputs only when their source file is available.
+    updated_artifact_kinds = set()
+    for artifact in plan['artifacts']:
+        if artifact['status'] in PENDING_ARTIFACT_STATUSES:
+            updated_artifact_kinds.add(artifact['kind'])
+    if write_species_abundance:
+        updated_artifact_kinds.add('species_abundance')
+    if write_library_qc:
+        updated_artifact_kinds.add('library_qc')
+    if updated_artifact_kinds:
+        changes.append_changes(config, [{'sequencing_run_id': run_id, 'action': 'updated', 'artifact_kinds': updated_artifact_kinds}])
+
+    # The run has been finalized, so it's no longer in progress.
+    update_in_progress_run(config, run_id, None)
+
+    # Runs with missing FastQC reports are retried with backoff, in case they appear later.
+    if any(fastqc_artifact['src_size_bytes'] is None for fastqc_artifact in artifacts_by_kind['fastqc']):
+        failures.record_failure(config, failure_registry, run_id, 'copy_fastqc_failed', analysis_dir['path'], plan['routine_sequence_qc_output_path'])
+    else:
+        failures.clear_failure(config, failure_registry, run_id)
 
     log.info({"event_type": "collect_outputs_complete", "sequencing_run_id": run_id, "analysis_dir_path": analysis_dir['path']})
+
+    return plan
@@ -0,0 +1,260 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+from typing import Callable, Optional
+
+import routine_sequence_qc_collector.locking as locking
+
+log = logging.getLogger(__name__)
+
+FAILURE_REGISTRY_FILENAME = 'failed_runs.json'
+
+DEFAULT_FAILURE_BACKOFF_INITIAL_SECONDS = 3600.0
+DEFAULT_FAILURE_BACKOFF_MAX_SECONDS = 7 * 24 * 3600.0
+
+# Runs may be collected in parallel, so updates to the registry file are serialized.
+# Other processes (the daemon, `collect`, `prune`, `quarantine`) are excluded by a lock file.
+failure_registry_lock = threading.Lock()
+
+
+def get_mtime(path: Optional[str]) -> Optional[float]:
+    """
+    Get the modification time of a path.
+
+    :param path: Path to a file or directory.
+    :type path: Optional[str]
+    :return: Modification time, or None if the path doesn't exist.
+    :rtype: Optional[float]
+    """
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError as e:
+        return None
+
+
+def load_failure_registry(config: dict[str, object]) -> dict[str, dict[str, object]]:
+    """
+    Load the registry of runs that have failed collection.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: Failed runs, indexed by run ID. Keys: ['sequencing_run_id', 'failure_reason', 'failure_count', 'first_failure_timestamp', 'last_failure_timestamp', 'next_attempt_timestamp', 'analysis_dir_path', 'analysis_dir_mtime', 'routine_sequence_qc_output_path', 'routine_sequence_qc_output_mtime']
+    :rtype: dict[str, dict[str, object]]
+    """
+    failure_registry_file = os.path.join(config['output_dir'], FAILURE_REGISTRY_FILENAME)
+    failure_registry = {}
+    if os.path.exists(failure_registry_file):
+        try:
+            with open(failure_registry_file, 'r') as f:
+                failure_registry = {failure['sequencing_run_id']: failure for failure in json.load(f)}
+        except json.decoder.JSONDecodeError as e:
+            log.warning({'event_type': 'load_failure_registry_failed', 'failure_registry_file': failure_registry_file})
+
+    return failure_registry
+
+
+def update_failure_registry(config: dict[str, object], update: Callable[[dict[str, dict[str, object]]], bool]):
+    """
+    Apply an update to the registry file. The registry is re-loaded under a lock, so
+    that updates made by other processes since it was last loaded aren't lost, and
+    it is only re-written if the update changed it.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param update: Function that updates the freshly-loaded registry in place, and returns whether it changed.
+    :type update: Callable[[dict[str, dict[str, object]]], bool]
+    :return: None
+    :rtype: None
+    """
+    failure_registry_file = os.path.join(config['output_dir'], FAILURE_REGISTRY_FILENAME)
+    with failure_registry_lock, locking.file_lock(failure_registry_file + '.lock'):
+        failure_registry = load_failure_registry(config)
+        if update(failure_registry):
+            locking.write_json_atomic(failure_registry_file, sorted(failure_registry.values(), key=lambda failure: failure['sequencing_run_id']), indent=2)
+
+
+def get_doubling_backoff_seconds(initial_seconds: float, num_doublings: int, max_seconds: float) -> float:
+    """
+    Double a wait a number of times, up to a maximum.
+
+    :param initial_seconds: Wait before any doubling, in seconds.
+    :type initial_seconds: float
+    :param num_doublings: Number of times to double the wait. Negative values are treated as 0.
+    :type num_doublings: int
+    :param max_seconds: Maximum wait, in seconds.
+    :type max_seconds: float
+    :return: Wait, in seconds.
+    :rtype: float
+    """
+    # Cap the exponent so that the multiplication can't overflow.
+    backoff_seconds = initial_seconds * (2 ** min(max(num_doublings, 0), 32))
+
+    return min(backoff_seconds, max_seconds)
+
+
+def get_backoff_seconds(config: dict[str, object], failure_count: int) -> float:
+    """
+    Get the time to wait before re-attempting a run that has failed collection.
+    The wait doubles with each consecutive failure, up to a maximum.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param failure_count: Number of consecutive failures.
+    :type failure_count: int
+    :return: Time to wait, in seconds.
+    :rtype: float
+    """
+    initial_seconds = float(config.get('failure_backoff_initial_seconds', DEFAULT_FAILURE_BACKOFF_INITIAL_SECONDS))
+    max_seconds = float(config.get('failure_backoff_max_seconds', DEFAULT_FAILURE_BACKOFF_MAX_SECONDS))
+
+    return get_doubling_backoff_seconds(initial_seconds, failure_count - 1, max_seconds)
+
+
+def record_failure(config: dict[str, object], failure_registry: Optional[dict[str, dict[str, object]]], run_id: str, failure_reason: str, analysis_dir_path: str, routine_sequence_qc_output_path: Optional[str]=None):
+    """
+    Record a failed collection attempt, in both the registry file and the in-memory registry.
+    Consecutive failures for the same reason increase the backoff; a failure for a
+    different reason starts the backoff again.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param failure_registry: Failed runs, indexed by run ID. If None, nothing is recorded.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param failure_reason: Reason for the failure (the 'event_type' that was logged).
+    :type failure_reason: str
+    :param analysis_dir_path: Path to the run's analysis dir.
+    :type analysis_dir_path: str
+    :param routine_sequence_qc_output_path: Path to the run's latest routine sequence QC output dir, if found.
+    :type routine_sequence_qc_output_path: Optional[str]
+    :return: None
+    :rtype: None
+    """
+    if failure_registry is None:
+        return None
+
+    now = datetime.datetime.now()
+    failure = None
+
+    def add_failure(latest_failure_registry):
+        nonlocal failure
+        previous_failure = latest_failure_registry.get(run_id, None)
+        if previous_failure is not None and previous_failure['failure_reason'] == failure_reason:
+            failure_count = previous_failure['failure_count'] + 1
+            first_failure_timestamp = previous_failure['first_failure_timestamp']
+        else:
+            failure_count = 1
+            first_failure_timestamp = now.isoformat()
+
+        backoff_seconds = get_backoff_seconds(config, failure_count)
+        failure = {
+            'sequencing_run_id': run_id,
+            'failure_reason': failure_reason,
+            'failure_count': failure_count,
+            'first_failure_timestamp': first_failure_timestamp,
+            'last_failure_timestamp': now.isoformat(),
+            'next_attempt_timestamp': (now + datetime.timedelta(seconds=backoff_seconds)).isoformat(),
+            'analysis_dir_path': analysis_dir_path,
+            'analysis_dir_mtime': get_mtime(analysis_dir_path),
+            'routine_sequence_qc_output_path': routine_sequence_qc_output_path,
+            'routine_sequence_qc_output_mtime': get_mtime(routine_sequence_qc_output_path),
+        }
+        latest_failure_registry[run_id] = failure
+        failure_registry[run_id] = failure
+        return True
+
+    update_failure_registry(config, add_failure)
+
+    log.info({
+        'event_type': 'run_quarantined',
+        'sequencing_run_id': run_id,
+        'failure_reason': failure_reason,
+        'failure_count': failure['failure_count'],
+        'next_attempt_timestamp': failure['next_attempt_timestamp'],
+    })
+
+
+def clear_failures(config: dict[str, object], failure_registry: Optional[dict[str, dict[str, object]]], run_ids: list[str]):
+    """
+    Remove runs from the registry file and the in-memory registry, if present.
+    The registry file is only re-written if any of the runs are in the in-memory registry.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param failure_registry: Failed runs, indexed by run ID. If None, nothing is cleared.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
+    :param run_ids: Sequencing run IDs.
+    :type run_ids: list[str]
+    :return: None
+    :rtype: None
+    """
+    if failure_registry is None:
+        return None
+    run_ids = [run_id for run_id in run_ids if run_id in failure_registry]
+    if not run_ids:
+        return None
+
+    def remove_failures(latest_failure_registry):
+        changed = False
+        for run_id in run_ids:
+            failure_registry.pop(run_id, None)
+            if latest_failure_registry.pop(run_id, None) is not None:
+                changed = True
+        return changed
+
+    update_failure_registry(config, remove_failures)
+    for run_id in run_ids:
+        log.info({'event_type': 'run_quarantine_cleared', 'sequencing_run_id': run_id})
+
+
+def clear_failure(config: dict[str, object], failure_registry: Optional[dict[str, dict[str, object]]], run_id: str):
+    """
+    Remove a run from the registry file and the in-memory registry, if present.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param failure_registry: Failed runs, indexed by run ID. If None, nothing is cleared.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :return: None
+    :rtype: None
+    """
+    clear_failures(config, failure_registry, [run_id])
+
+
+def is_quarantined(failure_registry: Optional[dict[str, dict[str, object]]], run_id: str, now: Optional[datetime.datetime]=None) -> bool:
+    """
+    Determine whether a run should be skipped because it failed collection recently.
+    A run is no longer quarantined once its backoff has expired, or once its analysis
+    dir or routine sequence QC output dir has been modified since the last failure.
+
+    :param failure_registry: Failed runs, indexed by run ID.
+    :type failure_registry: Optional[dict[str, dict[str, object]]]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param now: Current time. Default: now.
+    :type now: Optional[datetime.datetime]
+    :return: Whether the run is quarantined.
+    :rtype: bool
+    """
+    if failure_registry is None or run_id not in failure_registry:
+        return False
+
+    failure = failure_registry[run_id]
+    if now is None:
+        now = datetime.datetime.now()
+    if now >= datetime.datetime.fromisoformat(failure['next_attempt_timestamp']):
+        return False
+    if get_mtime(failure['analysis_dir_path']) != failure['analysis_dir_mtime']:
+        return False
+    if get_mtime(failure['routine_sequence_qc_output_path']) != failure['routine_sequence_qc_output_mtime']:
+        return False
+
+    return True
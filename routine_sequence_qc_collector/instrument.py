@@ -1,3 +1,4 @@
+import datetime
 import re
 import logging
 
@@ -44,3 +45,27 @@ def determine_instrument_type(run_id: str):
     return instrument_type
 
 
+def get_run_date(run_id: str):
+    """
+    Get the run date that is encoded at the start of the run ID.
+    MiSeq and NextSeq run IDs start with the date as YYMMDD, i100 run IDs start with YYYYMMDD.
+    :param run_id: The run ID
+    :type run_id: str
+    :return: The run date, or None if the run ID isn't supported or the date can't be parsed.
+    :rtype: Optional[datetime.date]
+    """
+    instrument_type = determine_instrument_type(run_id)
+    run_date_str = run_id.split('_')[0]
+    if instrument_type in ['miseq', 'nextseq']:
+        run_date_format = '%y%m%d'
+    elif instrument_type == 'i100':
+        run_date_format = '%Y%m%d'
+    else:
+        return None
+
+    try:
+        run_date = datetime.datetime.strptime(run_date_str, run_date_format).date()
+    except ValueError as e:
+        run_date = None
+
+    return run_date
@@ -0,0 +1,58 @@
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+
+from typing import Iterator
+
+# The umask can only be read by setting it. It is read once, at import, before
+# any threads that might create files have started.
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on a lock file, so that the daemon and subcommands
+    running in other processes don't update the same files at the same time.
+    Locks are per open file, so threads in the same process also exclude each other.
+
+    :param lock_path: Path to the lock file. Created if it doesn't exist.
+    :type lock_path: str
+    :return: None
+    :rtype: Iterator[None]
+    """
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path: str, obj: object, **json_dump_kwargs):
+    """
+    Write json to a temporary file in the same directory, then move it into place,
+    so that readers never see a partially-written file. The file gets the same
+    permissions as one created with `open`, rather than the owner-only permissions
+    of a temporary file.
+
+    :param path: Path to the json file.
+    :type path: str
+    :param obj: Object to write.
+    :type obj: object
+    :param json_dump_kwargs: Passed to `json.dump` (eg. indent).
+    :return: None
+    :rtype: None
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        os.fchmod(fd, 0o666 & ~UMASK)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(obj, f, **json_dump_kwargs)
+        os.replace(tmp_path, path)
+    except BaseException as e:
+        os.remove(tmp_path)
+        raise
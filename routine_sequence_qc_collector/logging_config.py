@@ -98,11 +98,12 @@ class JSONFormatter(logging.Formatter):
             return self._safe_serialize(log_entry)
 
 
-def configure_logging(log_level: str="info"):
+def configure_logging(log_level: str="info", stream=sys.stdout):
     """
     Configure logging
 
     :param log_level: Log level ('debug', 'info', 'warning', 'error') default: 'info'
+    :param stream: Stream to write log records to. default: sys.stdout
     """
     log_level_attr = logging.INFO
     try:
@@ -113,7 +114,7 @@ def configure_logging(log_level: str="info"):
         datefmt='%Y-%m-%dT%H:%M:%S',
         encoding='utf-8',
         level=log_level_attr,
-        handlers=[logging.StreamHandler(sys.stdout)]
+        handlers=[logging.StreamHandler(stream)]
     )
     logging.getLogger().handlers[0].setFormatter(JSONFormatter())
 
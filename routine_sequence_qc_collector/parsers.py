@@ -5,3 +5,114 @@ import logging
 
 log = logging.getLogger(__name__)
 
+
+def parse_bracken_abundances(lines):
+    """
+    Parse bracken abundances (tab-separated, with header). Entries with no
+    estimated reads are dropped.
+
+    :param lines: Lines of a bracken abundances file.
+    :type lines: Iterable[str]
+    :return: Abundances. Keys: ['name', 'taxonomy_id', 'taxonomy_lvl', 'new_est_reads', 'fraction_total_reads']
+    :rtype: list[dict[str, object]]
+    """
+    abundances = []
+    reader = csv.DictReader(lines, dialect='excel-tab')
+    for row in reader:
+        try:
+            new_est_reads = int(row['new_est_reads'])
+            fraction_total_reads = float(row['fraction_total_reads'])
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning({'event_type': 'parse_bracken_abundance_failed', 'taxonomy_id': row.get('taxonomy_id', None)})
+            continue
+        if new_est_reads == 0:
+            continue
+        abundance = {
+            'name': row['name'],
+            'taxonomy_id': row['taxonomy_id'],
+            'taxonomy_lvl': row['taxonomy_lvl'],
+            'new_est_reads': new_est_reads,
+            'fraction_total_reads': fraction_total_reads,
+        }
+        abundances.append(abundance)
+
+    return abundances
+
+
+def parse_fastqc_data(lines):
+    """
+    Parse key metrics from a FastQC `fastqc_data.txt` file, one line at a time.
+    Only the 'Basic Statistics', 'Sequence Duplication Levels' and 'Adapter Content'
+    modules are read. The adapter content is the highest percentage of reads with
+    any single adapter, at any position. Metrics that aren't found are None.
+
+    :param lines: Lines of a `fastqc_data.txt` file.
+    :type lines: Iterable[str]
+    :return: Metrics. Keys: ['total_sequences', 'percent_gc', 'percent_duplicates', 'max_percent_adapter_content']
+    :rtype: dict[str, object]
+    """
+    metrics = {
+        'total_sequences': None,
+        'percent_gc': None,
+        'percent_duplicates': None,
+        'max_percent_adapter_content': None,
+    }
+    module = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.startswith('>>END_MODULE'):
+            module = None
+            continue
+        if line.startswith('>>'):
+            module = line[2:].split('\t')[0]
+            continue
+        fields = line.split('\t')
+        try:
+            if module == 'Basic Statistics':
+                if fields[0] == 'Total Sequences':
+                    metrics['total_sequences'] = int(fields[1])
+                elif fields[0] == '%GC':
+                    metrics['percent_gc'] = float(fields[1])
+            elif module == 'Sequence Duplication Levels':
+                if fields[0] == '#Total Deduplicated Percentage':
+                    metrics['percent_duplicates'] = 100.0 - float(fields[1])
+            elif module == 'Adapter Content' and not line.startswith('#'):
+                max_percent_adapter_content = max(float(value) for value in fields[1:])
+                if metrics['max_percent_adapter_content'] is None or max_percent_adapter_content > metrics['max_percent_adapter_content']:
+                    metrics['max_percent_adapter_content'] = max_percent_adapter_content
+        except (IndexError, ValueError) as e:
+            log.warning({'event_type': 'parse_fastqc_data_failed', 'fastqc_module': module, 'line': line})
+
+    return metrics
+
+
+def parse_multiqc_general_stats(lines):
+    """
+    Parse a MultiQC general stats table (`multiqc_data/multiqc_general_stats.txt`, tab-separated,
+    with header). Column names are shortened by removing the MultiQC section prefix,
+    eg. 'FastQC_mqc-generalstats-fastqc-percent_gc' -> 'fastqc-percent_gc'. Values
+    that aren't numeric (including empty values) are None.
+
+    :param lines: Lines of a MultiQC general stats file.
+    :type lines: Iterable[str]
+    :return: General stats, indexed by sample name.
+    :rtype: dict[str, dict[str, Optional[float]]]
+    """
+    general_stats_by_sample_name = {}
+    reader = csv.reader(lines, dialect='excel-tab')
+    header = next(reader, None)
+    if header is None:
+        return general_stats_by_sample_name
+    column_names = [column_name.split('generalstats-')[-1] for column_name in header[1:]]
+    for row in reader:
+        if not row:
+            continue
+        general_stats = {}
+        for column_name, value in zip(column_names, row[1:]):
+            try:
+                general_stats[column_name] = float(value)
+            except ValueError as e:
+                general_stats[column_name] = None
+        general_stats_by_sample_name[row[0]] = general_stats
+
+    return general_stats_by_sample_name
@@ -0,0 +1,114 @@
+import datetime
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+PROFILES_SUBDIR = 'profiles'
+PROFILE_FILENAME_PREFIX = 'scan-cycle-'
+
+DEFAULT_PROFILE_MAX_CYCLES = 10
+DEFAULT_TOP_ALLOCATIONS = 25
+
+
+def start_cycle_profile() -> dict[str, object]:
+    """
+    Start profiling a scan cycle, with cProfile (CPU time) and tracemalloc (memory allocations).
+    The profiling modules are only imported when profiling is used.
+
+    :return: Profile in progress. Keys: ['start_timestamp', 'profiler']
+    :rtype: dict[str, object]
+    """
+    import cProfile
+    import tracemalloc
+
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    cycle_profile = {
+        'start_timestamp': datetime.datetime.now(),
+        'profiler': profiler,
+    }
+    log.info({"event_type": "scan_cycle_profile_start"})
+
+    return cycle_profile
+
+
+def rotate_profiles(profiles_dir: str, max_cycles: int):
+    """
+    Delete the files for all but the most recent profiled scan cycles.
+
+    :param profiles_dir: Directory where profiles are written.
+    :type profiles_dir: str
+    :param max_cycles: Number of profiled scan cycles to keep.
+    :type max_cycles: int
+    :return: None
+    :rtype: None
+    """
+    files_by_cycle = {}
+    for filename in os.listdir(profiles_dir):
+        if filename.startswith(PROFILE_FILENAME_PREFIX):
+            # eg. 'scan-cycle-20240105T101502_000123.pstats' -> 'scan-cycle-20240105T101502_000123'
+            cycle_name = filename.split('.')[0].removesuffix('-allocations')
+            files_by_cycle.setdefault(cycle_name, []).append(os.path.join(profiles_dir, filename))
+
+    # Cycle names sort by timestamp, oldest first.
+    cycle_names = sorted(files_by_cycle.keys())
+    num_expired_cycles = max(0, len(cycle_names) - max(1, max_cycles))
+    for cycle_name in cycle_names[:num_expired_cycles]:
+        for path in files_by_cycle[cycle_name]:
+            os.remove(path)
+
+
+def finish_cycle_profile(config: dict[str, object], cycle_profile: dict[str, object]) -> dict[str, str]:
+    """
+    Stop profiling a scan cycle, and write the profile to the 'profiles' subdirectory
+    of the output dir. A .pstats file (cProfile stats, which can be loaded with
+    the `pstats` module or tools like `snakeviz`) and a report of the top memory
+    allocations are written. Only the most recent 'profile_max_cycles' profiles are kept.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param cycle_profile: Profile in progress, as returned by `start_cycle_profile`.
+    :type cycle_profile: dict[str, object]
+    :return: Paths to the profile files. Keys: ['pstats_path', 'allocations_path']
+    :rtype: dict[str, str]
+    """
+    import tracemalloc
+
+    profiler = cycle_profile['profiler']
+    profiler.disable()
+    snapshot = tracemalloc.take_snapshot()
+    current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    profiles_dir = os.path.join(config['output_dir'], PROFILES_SUBDIR)
+    os.makedirs(profiles_dir, exist_ok=True)
+    cycle_name = PROFILE_FILENAME_PREFIX + cycle_profile['start_timestamp'].strftime('%Y%m%dT%H%M%S_%f')
+    pstats_path = os.path.join(profiles_dir, cycle_name + '.pstats')
+    allocations_path = os.path.join(profiles_dir, cycle_name + '-allocations.txt')
+
+    profiler.dump_stats(pstats_path)
+
+    top_allocations = int(config.get('profile_top_allocations', DEFAULT_TOP_ALLOCATIONS))
+    with open(allocations_path, 'w') as f:
+        f.write('# traced memory: current {} bytes, peak {} bytes\n'.format(current_bytes, peak_bytes))
+        f.write('# top {} allocations by line\n'.format(top_allocations))
+        for stat in snapshot.statistics('lineno')[:top_allocations]:
+            f.write(str(stat) + '\n')
+
+    max_cycles = int(config.get('profile_max_cycles', DEFAULT_PROFILE_MAX_CYCLES))
+    rotate_profiles(profiles_dir, max_cycles)
+
+    profile_paths = {
+        'pstats_path': pstats_path,
+        'allocations_path': allocations_path,
+    }
+    log.info({
+        "event_type": "scan_cycle_profile_complete",
+        "profile_duration_seconds": (datetime.datetime.now() - cycle_profile['start_timestamp']).total_seconds(),
+        "traced_memory_peak_bytes": peak_bytes,
+        **profile_paths,
+    })
+
+    return profile_paths
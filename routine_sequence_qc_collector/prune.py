@@ -0,0 +1,191 @@
+import concurrent.futures
+import json
+import logging
+import os
+import re
+import shutil
+
+from typing import Optional
+
+import routine_sequence_qc_collector.changes as changes
+import routine_sequence_qc_collector.core as core
+import routine_sequence_qc_collector.failures as failures
+import routine_sequence_qc_collector.instrument as instrument
+
+log = logging.getLogger(__name__)
+
+
+def find_collected_run_ids(config: dict[str, object]) -> set[str]:
+    """
+    Find the IDs of all runs that have collected outputs. Each output
+    subdirectory is listed once, and run IDs are parsed from the entry names.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: IDs of runs with collected outputs.
+    :rtype: set[str]
+    """
+    collected_run_ids = set()
+    for output_subdir in [os.path.join(config['output_dir'], output_subdir) for output_subdir in core.OUTPUT_SUBDIRS]:
+        if not os.path.isdir(output_subdir):
+            continue
+        for entry_name in os.listdir(output_subdir):
+            for regex in instrument.RUN_ID_REGEX_BY_INSTRUMENT_TYPE.values():
+                run_id_match = re.match(regex, entry_name)
+                if run_id_match:
+                    collected_run_ids.add(run_id_match.group(0))
+
+    return collected_run_ids
+
+
+def select_runs_to_prune(config: dict[str, object], collected_run_ids: set[str], excluded: bool=False, retention_months: Optional[int]=None) -> list[str]:
+    """
+    Select collected runs that should be pruned.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param collected_run_ids: IDs of runs with collected outputs.
+    :type collected_run_ids: set[str]
+    :param excluded: Select runs that are listed in the 'excluded_runs_list'.
+    :type excluded: bool
+    :param retention_months: Select runs older than this many months.
+    :type retention_months: Optional[int]
+    :return: IDs of runs to prune, sorted.
+    :rtype: list[str]
+    """
+    run_ids_to_prune = set()
+    if excluded:
+        run_ids_to_prune.update(collected_run_ids & set(config['excluded_runs']))
+    if retention_months:
+        retention_config = {'retention_months': retention_months}
+        for run_id in collected_run_ids:
+            if not core.is_within_retention_period(retention_config, run_id):
+                run_ids_to_prune.add(run_id)
+
+    return sorted(run_ids_to_prune)
+
+
+def get_size_bytes(path: str) -> int:
+    """
+    Get the total size of a file, or of all files under a directory.
+
+    :param path: Path to a file or directory.
+    :type path: str
+    :return: Size in bytes.
+    :rtype: int
+    """
+    if not os.path.isdir(path):
+        return os.stat(path).st_size
+
+    size_bytes = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            size_bytes += os.stat(os.path.join(dirpath, filename)).st_size
+
+    return size_bytes
+
+
+def delete_run_outputs(config: dict[str, object], run_id: str, dry_run: bool=False) -> int:
+    """
+    Delete all collected outputs for a run.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_id: Sequencing run ID.
+    :type run_id: str
+    :param dry_run: Only measure the outputs, don't delete them.
+    :type dry_run: bool
+    :return: Number of bytes reclaimed (or that would be reclaimed, for a dry run).
+    :rtype: int
+    """
+    reclaimed_bytes = 0
+    for output_path in core.get_run_output_paths(config, run_id):
+        try:
+            size_bytes = get_size_bytes(output_path)
+        except FileNotFoundError as e:
+            continue
+        if not dry_run:
+            if os.path.isdir(output_path):
+                shutil.rmtree(output_path)
+            else:
+                os.remove(output_path)
+        reclaimed_bytes += size_bytes
+
+    log.debug({"event_type": "delete_run_outputs_complete", "sequencing_run_id": run_id, "reclaimed_bytes": reclaimed_bytes, "dry_run": dry_run})
+
+    return reclaimed_bytes
+
+
+def remove_runs_from_runs_file(config: dict[str, object], run_ids: set[str]):
+    """
+    Remove runs from the 'runs.json' file in the output dir, if it exists.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_ids: IDs of runs to remove.
+    :type run_ids: set[str]
+    :return: None
+    :rtype: None
+    """
+    runs_output_file = os.path.join(config['output_dir'], 'runs.json')
+    if not os.path.exists(runs_output_file):
+        return None
+
+    with open(runs_output_file, 'r') as f:
+        runs = json.load(f)
+    runs = [run for run in runs if run['run_id'] not in run_ids]
+    with open(runs_output_file, 'w') as f:
+        json.dump(runs, f, indent=2)
+
+    log.info({"event_type": "write_runs_file_complete", "runs_file": runs_output_file})
+
+
+def prune(config: dict[str, object], run_ids: list[str], workers: int=1, dry_run: bool=False) -> dict[str, object]:
+    """
+    Delete the collected outputs for a set of runs in parallel, then remove
+    them from the 'runs.json' file, the in-progress runs and the failure registry, and add them to
+    the change feed, in a single update each.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_ids: IDs of runs to prune.
+    :type run_ids: list[str]
+    :param workers: Number of runs to delete in parallel.
+    :type workers: int
+    :param dry_run: Only report what would be pruned, don't delete anything.
+    :type dry_run: bool
+    :return: Summary of the prune. Keys: ['dry_run', 'num_runs_pruned', 'pruned_run_ids', 'num_runs_failed', 'failed_run_ids', 'reclaimed_bytes']
+    :rtype: dict[str, object]
+    """
+    log.info({"event_type": "prune_start", "num_runs": len(run_ids), "dry_run": dry_run})
+    pruned_run_ids = []
+    failed_run_ids = []
+    reclaimed_bytes = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(delete_run_outputs, config, run_id, dry_run): run_id for run_id in run_ids}
+        for future in concurrent.futures.as_completed(futures):
+            run_id = futures[future]
+            try:
+                reclaimed_bytes += future.result()
+                pruned_run_ids.append(run_id)
+            except OSError as e:
+                log.error({"event_type": "delete_run_outputs_failed", "sequencing_run_id": run_id, "error": str(e)})
+                failed_run_ids.append(run_id)
+
+    if not dry_run and pruned_run_ids:
+        remove_runs_from_runs_file(config, set(pruned_run_ids))
+        core.remove_in_progress_runs(config, pruned_run_ids)
+        failures.clear_failures(config, failures.load_failure_registry(config), pruned_run_ids)
+        changes.append_changes(config, [{'sequencing_run_id': run_id, 'action': 'deleted', 'artifact_kinds': []} for run_id in sorted(pruned_run_ids)])
+
+    summary = {
+        'dry_run': dry_run,
+        'num_runs_pruned': len(pruned_run_ids),
+        'pruned_run_ids': sorted(pruned_run_ids),
+        'num_runs_failed': len(failed_run_ids),
+        'failed_run_ids': sorted(failed_run_ids),
+        'reclaimed_bytes': reclaimed_bytes,
+    }
+    log.info({"event_type": "prune_complete", "num_runs_pruned": summary['num_runs_pruned'], "num_runs_failed": summary['num_runs_failed'], "reclaimed_bytes": reclaimed_bytes, "dry_run": dry_run})
+
+    return summary
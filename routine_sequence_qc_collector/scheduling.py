@@ -0,0 +1,244 @@
+import datetime
+import json
+import logging
+import os
+
+from typing import Optional
+
+import routine_sequence_qc_collector.core as core
+import routine_sequence_qc_collector.failures as failures
+import routine_sequence_qc_collector.instrument as instrument
+import routine_sequence_qc_collector.locking as locking
+
+log = logging.getLogger(__name__)
+
+RUN_ARRIVALS_FILENAME = 'run_arrivals.json'
+RUN_ARRIVALS_MAX_ENTRIES = 1000
+
+DEFAULT_SCAN_INTERVAL_SECONDS = 3600.0
+DEFAULT_SCAN_INTERVAL_MIN_SECONDS = 300.0
+DEFAULT_SCAN_INTERVAL_MAX_SECONDS = 4 * 3600.0
+
+# Runs whose analysis completed long after the run date were re-analyzed,
+# so they don't reflect when new runs usually arrive.
+MAX_ARRIVAL_LAG_DAYS = 7
+# Arrival patterns aren't used until enough arrivals have been seen.
+MIN_ARRIVALS_FOR_SCHEDULE = 10
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def load_arrival_history(config: dict[str, object]) -> dict[str, object]:
+    """
+    Load the record of when runs' analyses completed.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: Arrival history. Keys: ['seen_run_ids', 'run_arrivals']. Run arrivals are oldest first, with keys: ['sequencing_run_id', 'run_date', 'arrival_timestamp']
+    :rtype: dict[str, object]
+    """
+    run_arrivals_file = os.path.join(config['output_dir'], RUN_ARRIVALS_FILENAME)
+    arrival_history = {'seen_run_ids': set(), 'run_arrivals': []}
+    if os.path.exists(run_arrivals_file):
+        try:
+            with open(run_arrivals_file, 'r') as f:
+                saved_arrival_history = json.load(f)
+            arrival_history['seen_run_ids'] = set(saved_arrival_history['seen_run_ids'])
+            arrival_history['run_arrivals'] = saved_arrival_history['run_arrivals']
+        except (json.decoder.JSONDecodeError, KeyError, TypeError) as e:
+            log.warning({'event_type': 'load_run_arrivals_failed', 'run_arrivals_file': run_arrivals_file})
+
+    return arrival_history
+
+
+def update_arrival_history(config: dict[str, object], runs: list[dict[str, object]], arrival_history: dict[str, object]) -> dict[str, object]:
+    """
+    Record the arrival of runs that haven't been seen before. A run arrives when its
+    analysis completes, which is taken from the modification time of its
+    `pipeline_complete.json` marker. Arrivals more than `MAX_ARRIVAL_LAG_DAYS` after
+    the run date (parsed from the run ID) are re-analyses, and aren't recorded.
+
+    Every run that has been checked is remembered, so each run's marker is only
+    stat'ed once, and the history is only re-written when new runs are seen. Only
+    the most recent `RUN_ARRIVALS_MAX_ENTRIES` arrivals are kept.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param runs: Runs, as returned by `core.find_runs`. Provisional runs are skipped.
+    :type runs: list[dict[str, object]]
+    :param arrival_history: Arrival history, as returned by `load_arrival_history`. Updated in place.
+    :type arrival_history: dict[str, object]
+    :return: Updated arrival history.
+    :rtype: dict[str, object]
+    """
+    seen_run_ids = arrival_history['seen_run_ids']
+    new_seen_run_ids = set()
+    new_run_arrivals = []
+    for run in runs:
+        run_id = run['run_id']
+        if run_id in seen_run_ids or run.get('provisional', False):
+            continue
+        latest_routine_sequence_qc_output = core.find_latest_routine_sequence_qc_output(os.path.join(config['analysis_by_run_dir'], run_id))
+        if latest_routine_sequence_qc_output is None:
+            continue
+        try:
+            analysis_complete_mtime = os.stat(os.path.join(latest_routine_sequence_qc_output, 'pipeline_complete.json')).st_mtime
+        except FileNotFoundError as e:
+            continue
+        new_seen_run_ids.add(run_id)
+        arrival_timestamp = datetime.datetime.fromtimestamp(analysis_complete_mtime)
+        run_date = instrument.get_run_date(run_id)
+        if run_date is not None and arrival_timestamp.date() - run_date > datetime.timedelta(days=MAX_ARRIVAL_LAG_DAYS):
+            continue
+        new_run_arrivals.append({
+            'sequencing_run_id': run_id,
+            'run_date': run_date.isoformat() if run_date is not None else None,
+            'arrival_timestamp': arrival_timestamp.isoformat(),
+        })
+
+    if not new_seen_run_ids:
+        return arrival_history
+
+    seen_run_ids.update(new_seen_run_ids)
+    run_arrivals = sorted(arrival_history['run_arrivals'] + new_run_arrivals, key=lambda arrival: arrival['arrival_timestamp'])
+    arrival_history['run_arrivals'] = run_arrivals[-RUN_ARRIVALS_MAX_ENTRIES:]
+    run_arrivals_file = os.path.join(config['output_dir'], RUN_ARRIVALS_FILENAME)
+    locking.write_json_atomic(run_arrivals_file, {'seen_run_ids': sorted(seen_run_ids), 'run_arrivals': arrival_history['run_arrivals']}, indent=2)
+
+    log.debug({"event_type": "update_run_arrivals_complete", "num_new_run_arrivals": len(new_run_arrivals), "num_new_seen_runs": len(new_seen_run_ids), "run_arrivals_file": run_arrivals_file})
+
+    return arrival_history
+
+
+def get_hour_of_week(timestamp: datetime.datetime) -> int:
+    """
+    :param timestamp: Timestamp.
+    :type timestamp: datetime.datetime
+    :return: Hour of the week, from 0 (Monday 00:00-00:59) to 167 (Sunday 23:00-23:59).
+    :rtype: int
+    """
+    return timestamp.weekday() * 24 + timestamp.hour
+
+
+def count_arrivals_by_hour_of_week(run_arrivals: list[dict[str, object]]) -> list[int]:
+    """
+    Count run arrivals in each hour of the week.
+
+    :param run_arrivals: Run arrivals, from the arrival history.
+    :type run_arrivals: list[dict[str, object]]
+    :return: Number of arrivals in each hour of the week.
+    :rtype: list[int]
+    """
+    arrival_counts = [0] * HOURS_PER_WEEK
+    for arrival in run_arrivals:
+        arrival_timestamp = datetime.datetime.fromisoformat(arrival['arrival_timestamp'])
+        arrival_counts[get_hour_of_week(arrival_timestamp)] += 1
+
+    return arrival_counts
+
+
+def get_arrival_likelihood(arrival_counts: list[int], hour_of_week: int) -> Optional[float]:
+    """
+    Estimate how likely runs are to arrive in an hour of the week, relative to an
+    average hour. Neighbouring hours are included, since arrival times vary.
+
+    :param arrival_counts: Number of arrivals in each hour of the week.
+    :type arrival_counts: list[int]
+    :param hour_of_week: Hour of the week.
+    :type hour_of_week: int
+    :return: Relative likelihood (1.0 is average), or None if too few arrivals have been seen.
+    :rtype: Optional[float]
+    """
+    total_arrivals = sum(arrival_counts)
+    if total_arrivals < MIN_ARRIVALS_FOR_SCHEDULE:
+        return None
+
+    smoothed_count = (
+        0.25 * arrival_counts[(hour_of_week - 1) % HOURS_PER_WEEK] +
+        0.5 * arrival_counts[hour_of_week] +
+        0.25 * arrival_counts[(hour_of_week + 1) % HOURS_PER_WEEK]
+    )
+    mean_count = total_arrivals / HOURS_PER_WEEK
+
+    return smoothed_count / mean_count
+
+
+def get_scan_interval_bounds(config: dict[str, object]) -> tuple[float, float, float]:
+    """
+    :param config: Application config.
+    :type config: dict[str, object]
+    :return: Base, minimum and maximum scan interval, in seconds.
+    :rtype: tuple[float, float, float]
+    """
+    scan_interval_seconds = float(config.get('scan_interval_seconds', DEFAULT_SCAN_INTERVAL_SECONDS))
+    scan_interval_min_seconds = min(float(config.get('scan_interval_min_seconds', DEFAULT_SCAN_INTERVAL_MIN_SECONDS)), scan_interval_seconds)
+    scan_interval_max_seconds = max(float(config.get('scan_interval_max_seconds', DEFAULT_SCAN_INTERVAL_MAX_SECONDS)), scan_interval_seconds)
+
+    return scan_interval_seconds, scan_interval_min_seconds, scan_interval_max_seconds
+
+
+def get_next_scan_interval(config: dict[str, object], run_arrivals: list[dict[str, object]], num_runs_collected: int, num_idle_scans: int, now: Optional[datetime.datetime]=None) -> dict[str, object]:
+    """
+    Choose the time between the start of this scan and the start of the next one.
+
+    If 'adaptive_scan_scheduling' is not enabled, this is always 'scan_interval_seconds'.
+    Otherwise:
+
+    - If any runs were collected in this scan, more may follow soon (or may still be in progress),
+      so the next scan is after 'scan_interval_min_seconds'.
+    - If runs are more likely than average to arrive now (based on the hours of the week
+      when previous runs arrived), the interval is shortened in proportion, down to
+      'scan_interval_min_seconds'.
+    - Otherwise, the interval doubles with each further consecutive scan that collected nothing,
+      up to 'scan_interval_max_seconds', but the next scan is never later than the start
+      of the next hour when runs are likely to arrive.
+
+    :param config: Application config.
+    :type config: dict[str, object]
+    :param run_arrivals: Run arrivals, from the arrival history (see `load_arrival_history`).
+    :type run_arrivals: list[dict[str, object]]
+    :param num_runs_collected: Number of runs that had outputs collected in this scan.
+    :type num_runs_collected: int
+    :param num_idle_scans: Number of consecutive scans (including this one) that collected nothing.
+    :type num_idle_scans: int
+    :param now: Current time. Default: now.
+    :type now: Optional[datetime.datetime]
+    :return: Next scan interval. Keys: ['scan_interval_seconds', 'reason', 'arrival_likelihood']. Reason is one of: 'fixed', 'run_collected', 'arrivals_likely', 'idle'
+    :rtype: dict[str, object]
+    """
+    scan_interval_seconds, scan_interval_min_seconds, scan_interval_max_seconds = get_scan_interval_bounds(config)
+    if not config.get('adaptive_scan_scheduling', False):
+        return {'scan_interval_seconds': scan_interval_seconds, 'reason': 'fixed', 'arrival_likelihood': None}
+
+    if now is None:
+        now = datetime.datetime.now()
+    arrival_counts = count_arrivals_by_hour_of_week(run_arrivals)
+    arrival_likelihood = get_arrival_likelihood(arrival_counts, get_hour_of_week(now))
+
+    if num_runs_collected > 0:
+        next_scan_interval_seconds = scan_interval_min_seconds
+        reason = 'run_collected'
+    elif arrival_likelihood is not None and arrival_likelihood > 1.0:
+        next_scan_interval_seconds = max(scan_interval_seconds / arrival_likelihood, scan_interval_min_seconds)
+        reason = 'arrivals_likely'
+    else:
+        next_scan_interval_seconds = failures.get_doubling_backoff_seconds(scan_interval_seconds, num_idle_scans - 1, scan_interval_max_seconds)
+        reason = 'idle'
+        if arrival_likelihood is not None:
+            # Don't back off past the start of the next hour when runs are likely to arrive.
+            next_scan_timestamp = now + datetime.timedelta(seconds=next_scan_interval_seconds)
+            next_hour = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+            while next_hour < next_scan_timestamp:
+                if get_arrival_likelihood(arrival_counts, get_hour_of_week(next_hour)) > 1.0:
+                    seconds_until_next_hour = (next_hour - now).total_seconds()
+                    next_scan_interval_seconds = max(seconds_until_next_hour, scan_interval_min_seconds)
+                    break
+                next_hour += datetime.timedelta(hours=1)
+
+    next_scan_interval = {
+        'scan_interval_seconds': next_scan_interval_seconds,
+        'reason': reason,
+        'arrival_likelihood': arrival_likelihood,
+    }
+
+    return next_scan_interval
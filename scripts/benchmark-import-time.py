@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that should only be imported by the subcommands that need them,
+# not when the CLI starts up.
+LAZY_MODULES = [
+    'cProfile',
+    'concurrent.futures',
+    'gzip',
+    'shutil',
+    'tracemalloc',
+    'routine_sequence_qc_collector.core',
+    'routine_sequence_qc_collector.profiling',
+    'routine_sequence_qc_collector.prune',
+    'routine_sequence_qc_collector.scheduling',
+]
+
+STARTUP_IMPORT = 'import routine_sequence_qc_collector.__main__'
+
+
+def measure_startup_seconds(python):
+    """
+    Measure the wall-clock time to start a new interpreter and import the CLI.
+    """
+    start = time.perf_counter()
+    subprocess.run([python, '-c', STARTUP_IMPORT], check=True)
+    return time.perf_counter() - start
+
+
+def find_imported_modules(python):
+    """
+    Find all modules that are imported at startup, using `python -X importtime`.
+    """
+    result = subprocess.run([python, '-X', 'importtime', '-c', STARTUP_IMPORT], check=True, capture_output=True, text=True)
+    imported_modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            imported_modules.add(line.split('|')[-1].strip())
+
+    return imported_modules
+
+
+def main(args):
+    """
+    Check that CLI startup stays fast, and that lazily-imported modules stay lazy.
+    Prints a json report and exits with a non-zero status if either check fails.
+    """
+    # The first run may include compiling bytecode, which isn't part of a normal start.
+    measure_startup_seconds(args.python)
+    startup_seconds = []
+    for _ in range(args.repeats):
+        startup_seconds.append(measure_startup_seconds(args.python))
+    imported_modules = find_imported_modules(args.python)
+    eagerly_imported_modules = sorted(m for m in LAZY_MODULES if m in imported_modules)
+
+    median_startup_seconds = statistics.median(startup_seconds)
+    report = {
+        'repeats': args.repeats,
+        'median_startup_seconds': median_startup_seconds,
+        'min_startup_seconds': min(startup_seconds),
+        'max_startup_seconds_allowed': args.max_seconds,
+        'eagerly_imported_modules': eagerly_imported_modules,
+    }
+    print(json.dumps(report, indent=2))
+
+    if median_startup_seconds > args.max_seconds or eagerly_imported_modules:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--repeats', type=int, default=10, help="Number of cold starts to measure (default: 10).")
+    parser.add_argument('--max-seconds', type=float, default=0.25, help="Maximum median startup time allowed (default: 0.25).")
+    parser.add_argument('--python', default=sys.executable, help="Python interpreter to use (default: this one).")
+    args = parser.parse_args()
+    main(args)
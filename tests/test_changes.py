@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+import routine_sequence_qc_collector.changes as changes
+
+
+class TestAppendChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.config = {'output_dir': self.output_dir.name}
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+
+    def append(self, run_id):
+        return changes.append_changes(self.config, [{'sequencing_run_id': run_id, 'action': 'updated', 'artifact_kinds': ['library_qc']}])
+
+    def test_seqs_are_contiguous(self):
+        for run_id in ['A', 'B', 'C']:
+            self.append(run_id)
+        records = list(changes.read_changes(self.config, 0))
+        self.assertEqual([record['seq'] for record in records], [1, 2, 3])
+        self.assertEqual([record['seq'] for record in changes.read_changes(self.config, 2)], [3])
+
+    def test_append_after_incomplete_line(self):
+        self.append('A')
+        [(first_seq, segment_path)] = changes.list_segments(self.config)
+        with open(segment_path, 'a') as f:
+            f.write('{"seq":2,"timest')
+        self.append('C')
+        records = list(changes.read_changes(self.config, 0))
+        self.assertEqual([record['sequencing_run_id'] for record in records], ['A', 'C'])
+        self.assertEqual([record['seq'] for record in records], [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
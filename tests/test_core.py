@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+import routine_sequence_qc_collector.core as core
+
+
+class TestGetArtifactStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.src_file = os.path.join(self.tmp_dir.name, 'src.txt')
+        self.dst_file = os.path.join(self.tmp_dir.name, 'dst.txt')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, path, mtime_ns):
+        with open(path, 'w') as f:
+            f.write('x')
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_unavailable_and_missing(self):
+        self.assertEqual(core.get_artifact_status(self.src_file, self.dst_file), ('unavailable', None, None))
+        self.write(self.src_file, 1000)
+        self.assertEqual(core.get_artifact_status(self.src_file, self.dst_file), ('missing', 1, 1000))
+
+    def test_up_to_date_once_mtime_set(self):
+        self.write(self.src_file, 1000)
+        # The collector's clock is ahead of the host that wrote the source.
+        self.write(self.dst_file, 5000)
+        self.assertEqual(core.get_artifact_status(self.src_file, self.dst_file)[0], 'stale')
+        core.set_output_mtime(self.dst_file, 1000)
+        self.assertEqual(core.get_artifact_status(self.src_file, self.dst_file)[0], 'up_to_date')
+
+    def test_stale_when_source_replaced_with_older_mtime(self):
+        self.write(self.src_file, 1000)
+        self.write(self.dst_file, 1000)
+        os.utime(self.src_file, ns=(500, 500))
+        self.assertEqual(core.get_artifact_status(self.src_file, self.dst_file)[0], 'stale')
+
+    def test_output_with_several_sources(self):
+        self.write(self.dst_file, 0)
+        self.assertEqual(core.get_output_status([None, None], core.stat_file(self.dst_file)), 'up_to_date')
+        self.write(self.src_file, 2000)
+        other_src_file = os.path.join(self.tmp_dir.name, 'other_src.txt')
+        self.write(other_src_file, 3000)
+        src_stats = [core.stat_file(self.src_file), None, core.stat_file(other_src_file)]
+        self.assertEqual(core.get_output_status(src_stats, core.stat_file(self.dst_file)), 'stale')
+        core.set_output_mtime(self.dst_file, 3000)
+        self.assertEqual(core.get_output_status(src_stats, core.stat_file(self.dst_file)), 'up_to_date')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import datetime
+import unittest
+
+import routine_sequence_qc_collector.scheduling as scheduling
+
+
+def make_run_arrivals(arrival_timestamps):
+    return [
+        {'sequencing_run_id': 'run-{}'.format(i), 'run_date': None, 'arrival_timestamp': arrival_timestamp.isoformat()}
+        for i, arrival_timestamp in enumerate(arrival_timestamps)
+    ]
+
+
+class TestGetNextScanInterval(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {
+            'adaptive_scan_scheduling': True,
+            'scan_interval_seconds': 3000,
+            'scan_interval_min_seconds': 300,
+            'scan_interval_max_seconds': 4 * 3600,
+        }
+        # Mondays, 11:xx
+        self.run_arrivals = make_run_arrivals([
+            datetime.datetime(2024, 1, 1, 11, minute) + datetime.timedelta(weeks=week)
+            for week in range(4) for minute in (5, 35, 50)
+        ])
+
+    def test_fixed_when_not_adaptive(self):
+        next_scan_interval = scheduling.get_next_scan_interval({'scan_interval_seconds': 3000}, self.run_arrivals, 0, 5)
+        self.assertEqual(next_scan_interval['scan_interval_seconds'], 3000.0)
+        self.assertEqual(next_scan_interval['reason'], 'fixed')
+
+    def test_min_interval_after_run_collected(self):
+        now = datetime.datetime(2024, 2, 7, 3, 0)
+        next_scan_interval = scheduling.get_next_scan_interval(self.config, self.run_arrivals, 1, 0, now=now)
+        self.assertEqual(next_scan_interval['scan_interval_seconds'], 300.0)
+        self.assertEqual(next_scan_interval['reason'], 'run_collected')
+
+    def test_idle_interval_doubles_up_to_max(self):
+        now = datetime.datetime(2024, 2, 7, 3, 0)
+        scan_interval_seconds = [
+            scheduling.get_next_scan_interval(self.config, self.run_arrivals, 0, num_idle_scans, now=now)['scan_interval_seconds']
+            for num_idle_scans in (1, 2, 3, 100)
+        ]
+        self.assertEqual(scan_interval_seconds, [3000.0, 6000.0, 12000.0, 4 * 3600.0])
+
+    def test_idle_scan_not_later_than_next_likely_hour(self):
+        # Hour 10 is likely, because it neighbours hour 11. The next likely hour
+        # starts less than a full hour from now, but before the next scan.
+        now = datetime.datetime(2024, 2, 5, 9, 50)
+        next_scan_interval = scheduling.get_next_scan_interval(self.config, self.run_arrivals, 0, 1, now=now)
+        self.assertEqual(next_scan_interval['reason'], 'idle')
+        self.assertEqual(next_scan_interval['scan_interval_seconds'], 600.0)
+
+    def test_idle_scan_not_earlier_than_min_interval(self):
+        now = datetime.datetime(2024, 2, 5, 9, 58)
+        next_scan_interval = scheduling.get_next_scan_interval(self.config, self.run_arrivals, 0, 1, now=now)
+        self.assertEqual(next_scan_interval['scan_interval_seconds'], 300.0)
+
+    def test_shortened_when_arrivals_likely(self):
+        now = datetime.datetime(2024, 2, 5, 11, 20)
+        next_scan_interval = scheduling.get_next_scan_interval(self.config, self.run_arrivals, 0, 1, now=now)
+        self.assertEqual(next_scan_interval['reason'], 'arrivals_likely')
+        self.assertLess(next_scan_interval['scan_interval_seconds'], 3000.0)
+        self.assertGreaterEqual(next_scan_interval['scan_interval_seconds'], 300.0)
+
+
+if __name__ == '__main__':
+    unittest.main()